@@ -0,0 +1,66 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class ResultCache:
+    """
+    LRU cache of query results that expire after ttl seconds. Concurrent misses
+    of the same key share a single load (single-flight). Only meant to be used
+    from the event loop thread.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 300) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.loading: dict[Hashable, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    async def get(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """Get the cached result of the key or load it"""
+        entry = self.entries.get(key)
+        if entry is not None:
+            expires, value = entry
+            if expires > time.monotonic():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return value
+            del self.entries[key]
+        task = self.loading.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return await asyncio.shield(task)
+        self.misses += 1
+        task = asyncio.ensure_future(loader())
+        self.loading[key] = task
+        task.add_done_callback(lambda task: self._store(key, task))
+        # Shielded so a cancelled request doesn't cancel the load of the others
+        return await asyncio.shield(task)
+
+    def _store(self, key: Hashable, task: asyncio.Task) -> None:
+        self.loading.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+        self.entries[key] = (time.monotonic() + self.ttl, task.result())
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self.entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
@@ -1,9 +1,19 @@
+import base64
+import binascii
+import json
 import logging
+import zlib
+from concurrent.futures import Executor
 from dataclasses import dataclass
 
 from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 
+from exceptions import InvalidCursor
+from metrics import request
+
+from .storage import run_in_executor
+
 logger = logging.getLogger(__name__)
 
 
@@ -14,15 +24,45 @@ class CallDTO:
     line_number: int
     file_name: str
     url: str
+    snippet: str | None = None
+
+
+def decode_items(items: list[dict]) -> list[dict]:
+    """Decompresses the source snippets stored with the calls"""
+    for item in items:
+        snippet = item.get("snippet")
+        if snippet is not None:
+            item["snippet"] = zlib.decompress(bytes(snippet)).decode("utf-8", "replace")
+    return items
+
+
+def encode_cursor(last_evaluated_key: dict) -> str:
+    """Opaque continuation token of a LastEvaluatedKey"""
+    data = json.dumps(last_evaluated_key, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(data).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, path: str) -> dict:
+    """Get the ExclusiveStartKey of a continuation token for the path"""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(data)
+    except (binascii.Error, ValueError):
+        raise InvalidCursor()
+    if not isinstance(key, dict) or key.get("path_") != path or not isinstance(key.get("id"), str):
+        raise InvalidCursor()
+    return {"path_": path, "id": key["id"]}
 
 
 class Call:
-    def __init__(self, dyn_client, table_name: str):
+    def __init__(self, dyn_client, table_name: str, executor: Executor | None = None):
         """
         :param dyn_resource: A Boto3 DynamoDB resource.
+        :param executor: Runs the blocking queries of the async methods.
         """
         self.table_name = table_name
         self.dyn_resource = dyn_client
+        self.executor = executor
         self.table = self._get_table()
 
     def _get_table(self):
@@ -47,13 +87,17 @@ class Call:
         page_number += 1
         start_count = (page_number * page_size) - page_size
         try:
-            response = self.table.query(
+            response = request(
+                self.table,
+                "query",
                 KeyConditionExpression=Key("path_").eq(path),
                 Limit=start_count or page_size,
             )
             if page_number > 1:
                 if  "LastEvaluatedKey" in response:
-                    response = self.table.query(
+                    response = request(
+                        self.table,
+                        "query",
                         KeyConditionExpression=Key("path_").eq(path),
                         Limit=page_size,
                         ExclusiveStartKey=response["LastEvaluatedKey"],
@@ -69,7 +113,45 @@ class Call:
             )
             raise
         else:
-            return response["Items"]
+            return decode_items(response["Items"])
+
+    def get_calls_page(
+        self, path: str, page_size: int, cursor: str | None = None
+    ) -> tuple[list[dict], str | None]:
+        """
+        Queries one page of calls with the module path, starting after the cursor.
+
+        :param path: Path to the module.
+        :param cursor: Continuation token of the previous page, None for the first one.
+        :return: The calls and the cursor of the next page, None if it's the last one.
+        """
+        kwargs = {
+            "KeyConditionExpression": Key("path_").eq(path),
+            "Limit": page_size,
+        }
+        if cursor:
+            kwargs["ExclusiveStartKey"] = decode_cursor(cursor, path)
+        try:
+            response = request(self.table, "query", **kwargs)
+        except ClientError as err:
+            logger.critical(
+                "Couldn't query for calls released in %s. Here's why: %s: %s",
+                path,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+        else:
+            last_key = response.get("LastEvaluatedKey")
+            return decode_items(response["Items"]), encode_cursor(last_key) if last_key else None
+
+    async def get_calls_async(self, path: str, page_number: int, page_size: int):
+        return await run_in_executor(self.executor, self.get_calls, path, page_number, page_size)
+
+    async def get_calls_page_async(
+        self, path: str, page_size: int, cursor: str | None = None
+    ) -> tuple[list[dict], str | None]:
+        return await run_in_executor(self.executor, self.get_calls_page, path, page_size, cursor)
 
     def get_partition_keys(self) -> set[str]:
         """
@@ -79,10 +161,12 @@ class Call:
         """
         try:
             keys = set()
-            response = self.table.scan()
+            response = request(self.table, "scan", ProjectionExpression='path_')
             keys.update(item['path_'] for item in response['Items'])
             while response.get('LastEvaluatedKey'):
-                response = self.table.scan(
+                response = request(
+                    self.table,
+                    "scan",
                     ExclusiveStartKey=response['LastEvaluatedKey'],
                     ProjectionExpression='path_'
                 )
@@ -1,17 +1,22 @@
 import logging
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 from .call import Call
+from .path import Path
 
 logger = logging.getLogger(__name__)
 
 CALLTABLENAME = "calls"
+PATHTABLENAME = "paths"
 
 
 class Dynamo:
     call_table: Call
+    path_table: Path
 
     def __init__(
         self,
@@ -19,20 +24,46 @@ class Dynamo:
         aws_access_key_id: str,
         aws_secret_access_key: str,
         aws_endpoint: str,
-        init_tables=False
+        init_tables=False,
+        pool_size: int = 10,
     ) -> None:
+        """
+        Creates one resource to be shared by the whole application, its
+        connection pool keeps pool_size connections alive between requests.
+        The async queries run in a pool with a thread for every connection.
+        """
         self.resource = boto3.resource(
             "dynamodb",
             region_name=aws_region,
             aws_access_key_id=aws_access_key_id,
             aws_secret_access_key=aws_secret_access_key,
             endpoint_url=aws_endpoint or None,
+            config=Config(
+                max_pool_connections=pool_size,
+                tcp_keepalive=True,
+            ),
         )
-        self.call_table = Call(self.resource, CALLTABLENAME)
+        self.executor = ThreadPoolExecutor(pool_size, thread_name_prefix="dynamo")
+        self.call_table = Call(self.resource, CALLTABLENAME, self.executor)
+        self.path_table = Path(self.resource, PATHTABLENAME, self.executor)
         if init_tables:
             logger.info("Starting DB")
             self.init_tables()
 
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_module_paths(self, tables: list[str]) -> dict[str, int | None]:
+        """
+        Get the distinct module paths and their usage count from the index,
+        falls back to scanning the calls when the scraper didn't build it yet.
+        """
+        paths = self.path_table.get_paths() if PATHTABLENAME in tables else {}
+        if not paths:
+            logger.warning("Module paths index is empty, scanning the calls")
+            paths = dict.fromkeys(self.call_table.get_partition_keys())
+        return paths
+
     def init_tables(self):
         if not self.exists(CALLTABLENAME):
             self.call_table.create_table()
@@ -0,0 +1,93 @@
+import logging
+from concurrent.futures import Executor
+
+from botocore.exceptions import ClientError
+
+from metrics import request
+
+from .storage import run_in_executor
+
+logger = logging.getLogger(__name__)
+
+
+class Path:
+    def __init__(self, dyn_client, table_name: str, executor: Executor | None = None):
+        """
+        :param dyn_resource: A Boto3 DynamoDB resource.
+        :param executor: Runs the blocking queries of the async methods.
+        """
+        self.table_name = table_name
+        self.dyn_resource = dyn_client
+        self.executor = executor
+        self.table = self._get_table()
+
+    def _get_table(self):
+        try:
+            table = self.dyn_resource.Table(self.table_name)
+            return table
+        except ClientError as err:
+            logger.critical(
+                f"Couldn't get table {self.table_name}",
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+    def get_paths(self) -> dict[str, int | None]:
+        """
+        Get every module path of the index maintained by the scraper, paths
+        without calls left are skipped. Listed paths are kept whatever their
+        count, it can lag behind when the scraper failed to update it.
+
+        :return: The usage count by module path, None if it is unknown.
+        """
+        try:
+            paths = {}
+            kwargs = {
+                "ProjectionExpression": "path_, call_count, #listed",
+                "ExpressionAttributeNames": {"#listed": "listed"},
+            }
+            while True:
+                response = request(self.table, "scan", **kwargs)
+                for item in response["Items"]:
+                    count = item.get("call_count")
+                    if count is not None and count > 0:
+                        paths[item["path_"]] = int(count)
+                    elif count is None or item.get("listed"):
+                        paths[item["path_"]] = None
+                if not response.get("LastEvaluatedKey"):
+                    break
+                kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        except ClientError as err:
+            logger.critical(
+                "Couldn't scan for paths. %s: %s",
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+        else:
+            return paths
+
+    def get_count(self, path: str) -> int:
+        """
+        Get the usage count of a module path.
+
+        :return: The count, 0 for unknown paths.
+        """
+        try:
+            response = request(
+                self.table, "get_item", Key={"path_": path}, ProjectionExpression="call_count"
+            )
+        except ClientError as err:
+            logger.critical(
+                "Couldn't get the count of %s. Here's why: %s: %s",
+                path,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+        else:
+            return int(response.get("Item", {}).get("call_count", 0))
+
+    async def get_count_async(self, path: str) -> int:
+        return await run_in_executor(self.executor, self.get_count, path)
@@ -0,0 +1,153 @@
+import logging
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import QUERY_DURATION
+
+from .call import decode_cursor, decode_items, encode_cursor
+from .storage import run_in_executor
+
+logger = logging.getLogger(__name__)
+
+CALLTABLENAME = "calls"
+PATHTABLENAME = "paths"
+
+
+class SQLite:
+    """
+    Embedded storage backend for single node deployments and tests, reads the
+    database written by the scraper. Every thread of the pool gets its own
+    read only connection, WAL mode lets them read while the scraper writes.
+    """
+
+    def __init__(self, path: str, pool_size: int = 10) -> None:
+        self.path = path
+        self.local = threading.local()
+        self.executor = ThreadPoolExecutor(pool_size, thread_name_prefix="sqlite")
+        self.call_table = SQLiteCall(self, self.executor)
+        self.path_table = SQLitePath(self, self.executor)
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.row_factory = sqlite3.Row
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA query_only=1")
+            self.local.connection = connection
+        return connection
+
+    def execute(self, table_name: str, operation: str, sql: str, parameters=()) -> list[sqlite3.Row]:
+        """Runs a query, recording its latency like the DynamoDB operations"""
+        try:
+            with QUERY_DURATION.time(table=table_name, operation=operation):
+                return self.connection().execute(sql, parameters).fetchall()
+        except sqlite3.Error as err:
+            logger.critical(f"Couldn't {operation} {table_name}. Here's why: {err}")
+            raise
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_module_paths(self, tables: list[str]) -> dict[str, int | None]:
+        """
+        Get the distinct module paths and their usage count from the index,
+        falls back to the calls when the scraper didn't build it yet.
+        """
+        paths = self.path_table.get_paths() if PATHTABLENAME in tables else {}
+        if not paths:
+            logger.warning("Module paths index is empty, reading the calls")
+            paths = dict.fromkeys(self.call_table.get_partition_keys())
+        return paths
+
+    def list_tables(self) -> list[str]:
+        rows = self.execute("sqlite_master", "scan", "SELECT name FROM sqlite_master WHERE type = 'table'")
+        return [row["name"] for row in rows]
+
+
+class SQLiteCall:
+    table_name = CALLTABLENAME
+
+    def __init__(self, database: SQLite, executor: ThreadPoolExecutor | None = None):
+        self.database = database
+        self.executor = executor
+
+    def get_calls(self, path: str, page_number: int, page_size: int) -> list[dict]:
+        """
+        Queries for calls with the module path, skipping the previous pages.
+
+        :param path: Path to the module.
+        :return: The list of calls for that module.
+        """
+        rows = self.database.execute(
+            self.table_name,
+            "query",
+            "SELECT * FROM calls WHERE path_ = ? ORDER BY id LIMIT ? OFFSET ?",
+            (path, page_size, page_number * page_size),
+        )
+        return decode_items([dict(row) for row in rows])
+
+    def get_calls_page(
+        self, path: str, page_size: int, cursor: str | None = None
+    ) -> tuple[list[dict], str | None]:
+        """
+        Queries one page of calls with the module path, seeking past the id of
+        the cursor in the primary key instead of skipping rows.
+
+        :param path: Path to the module.
+        :param cursor: Continuation token of the previous page, None for the first one.
+        :return: The calls and the cursor of the next page, None if it's the last one.
+        """
+        last_id = decode_cursor(cursor, path)["id"] if cursor else ""
+        # One more row tells if there is a next page
+        rows = self.database.execute(
+            self.table_name,
+            "query",
+            "SELECT * FROM calls WHERE path_ = ? AND id > ? ORDER BY id LIMIT ?",
+            (path, last_id, page_size + 1),
+        )
+        items = [dict(row) for row in rows[:page_size]]
+        next_cursor = None
+        if len(rows) > page_size:
+            next_cursor = encode_cursor({"path_": path, "id": items[-1]["id"]})
+        return decode_items(items), next_cursor
+
+    async def get_calls_async(self, path: str, page_number: int, page_size: int) -> list[dict]:
+        return await run_in_executor(self.executor, self.get_calls, path, page_number, page_size)
+
+    async def get_calls_page_async(
+        self, path: str, page_size: int, cursor: str | None = None
+    ) -> tuple[list[dict], str | None]:
+        return await run_in_executor(self.executor, self.get_calls_page, path, page_size, cursor)
+
+    def get_partition_keys(self) -> set[str]:
+        rows = self.database.execute(self.table_name, "scan", "SELECT DISTINCT path_ FROM calls")
+        return {row["path_"] for row in rows}
+
+
+class SQLitePath:
+    table_name = PATHTABLENAME
+
+    def __init__(self, database: SQLite, executor: ThreadPoolExecutor | None = None):
+        self.database = database
+        self.executor = executor
+
+    def get_paths(self) -> dict[str, int | None]:
+        """
+        Get every module path of the index maintained by the scraper, paths
+        without calls left are skipped.
+        """
+        rows = self.database.execute(
+            self.table_name, "scan", "SELECT path_, call_count FROM paths WHERE call_count > 0"
+        )
+        return {row["path_"]: row["call_count"] for row in rows}
+
+    def get_count(self, path: str) -> int:
+        rows = self.database.execute(
+            self.table_name, "get_item", "SELECT call_count FROM paths WHERE path_ = ?", (path,)
+        )
+        return rows[0]["call_count"] if rows else 0
+
+    async def get_count_async(self, path: str) -> int:
+        return await run_in_executor(self.executor, self.get_count, path)
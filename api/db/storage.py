@@ -0,0 +1,60 @@
+import asyncio
+from concurrent.futures import Executor
+from functools import partial
+from typing import Callable, Protocol
+
+
+async def run_in_executor(executor: Executor | None, function: Callable, *args):
+    """
+    Runs a blocking call of a table in the executor without blocking the event
+    loop, the default executor when None
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(function, *args))
+
+
+class CallStore(Protocol):
+    def get_calls(self, path: str, page_number: int, page_size: int) -> list[dict]:
+        ...
+
+    def get_calls_page(
+        self, path: str, page_size: int, cursor: str | None = None
+    ) -> tuple[list[dict], str | None]:
+        ...
+
+    async def get_calls_async(self, path: str, page_number: int, page_size: int) -> list[dict]:
+        ...
+
+    async def get_calls_page_async(
+        self, path: str, page_size: int, cursor: str | None = None
+    ) -> tuple[list[dict], str | None]:
+        ...
+
+    def get_partition_keys(self) -> set[str]:
+        ...
+
+
+class PathStore(Protocol):
+    def get_paths(self) -> dict[str, int | None]:
+        ...
+
+    def get_count(self, path: str) -> int:
+        ...
+
+    async def get_count_async(self, path: str) -> int:
+        ...
+
+
+class Storage(Protocol):
+    """Tables the API reads from, implemented by the DynamoDB and the SQLite backends"""
+    call_table: CallStore
+    path_table: PathStore
+
+    def list_tables(self) -> list[str]:
+        ...
+
+    def get_module_paths(self, tables: list[str]) -> dict[str, int | None]:
+        ...
+
+    def close(self):
+        ...
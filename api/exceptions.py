@@ -1,3 +1,8 @@
 class TableNotFound(Exception):
     def __init__(self, message="Database tables are not initialized"):
         super().__init__(message)
+
+
+class InvalidCursor(Exception):
+    def __init__(self, message="Invalid pagination cursor"):
+        super().__init__(message)
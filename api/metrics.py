@@ -0,0 +1,127 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Iterator
+
+# Seconds, the default buckets of the Prometheus clients
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...], **extra: str) -> str:
+    pairs = [*zip(names, values), *extra.items()]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(str(value))}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help_
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, value: float = 1, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{format_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(
+        self, name: str, help_: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = BUCKETS
+    ) -> None:
+        self.name = name
+        self.help = help_
+        self.labels = labels
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # Label values to the per bucket counts, the last one is +Inf, and the sum
+        self.values: dict[tuple[str, ...], tuple[list[int], float]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[name]) for name in self.labels)
+        with self.lock:
+            counts, total = self.values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            for key, (counts, total) in sorted(self.values.items()):
+                cumulative = 0
+                for bucket, count in zip((*self.buckets, "+Inf"), counts):
+                    cumulative += count
+                    labels = format_labels(self.labels, key, le=str(bucket))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+def render_gauges(name: str, help_: str, values: dict[str, float], label: str) -> list[str]:
+    """Gauges of values read when rendering, like the cache stats"""
+    lines = [f"# HELP {name} {help_}", f"# TYPE {name} gauge"]
+    lines += [f"{name}{format_labels((label,), (key,))} {value}" for key, value in values.items()]
+    return lines
+
+
+REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "Latency of the HTTP requests", ("method", "route", "status")
+)
+QUERY_DURATION = Histogram(
+    "dynamodb_query_duration_seconds", "Latency of the DynamoDB operations", ("table", "operation")
+)
+CONSUMED_CAPACITY = Counter(
+    "dynamodb_consumed_read_capacity_units_total",
+    "Read capacity units consumed by the DynamoDB operations",
+    ("table", "operation"),
+)
+
+
+def record_capacity(table: str, operation: str, response: dict) -> None:
+    capacity = response.get("ConsumedCapacity")
+    if capacity:
+        CONSUMED_CAPACITY.inc(float(capacity.get("CapacityUnits", 0)), table=table, operation=operation)
+
+
+def request(table, operation: str, **kwargs) -> dict:
+    """
+    Runs an operation of a Boto3 DynamoDB table, recording its latency and
+    consumed capacity
+    """
+    with QUERY_DURATION.time(table=table.name, operation=operation):
+        response = getattr(table, operation)(ReturnConsumedCapacity="TOTAL", **kwargs)
+    record_capacity(table.name, operation, response)
+    return response
+
+
+def render(cache_stats: dict[str, int] | None = None) -> str:
+    lines = [*REQUEST_DURATION.render(), *QUERY_DURATION.render(), *CONSUMED_CAPACITY.render()]
+    if cache_stats is not None:
+        lines += render_gauges("result_cache", "Result cache size and counters", cache_stats, "stat")
+    return "\n".join(lines) + "\n"
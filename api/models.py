@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class Call(BaseModel):
@@ -7,6 +7,31 @@ class Call(BaseModel):
     line_number: int
     file_name: str
     url: str
+    snippet: str | None = None
+
+class BatchRequest(BaseModel):
+    paths: list[str] = Field(..., min_items=1, max_items=100)
+    limit: int = Field(20, ge=1, le=100)
+
+class BatchResult(BaseModel):
+    path: str
+    calls: list[Call]
+
+class BatchError(BaseModel):
+    path: str
+    error: str
+
+class PathCount(BaseModel):
+    path: str
+    count: int
 
 class Message(BaseModel):
     message: str
+
+class CacheStats(BaseModel):
+    size: int
+    max_size: int
+    hits: int
+    misses: int
+    coalesced: int
+    evictions: int
@@ -0,0 +1,208 @@
+import gzip
+import heapq
+import json
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from hashlib import sha1
+from typing import Callable, Hashable, Iterable
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+ENCODINGS = ("br", "gzip", "identity") if brotli else ("gzip", "identity")
+
+
+def build_tree(paths: list[str]) -> dict[str, dict]:
+    """
+    Nests every path under its dotted prefixes, in linear time of the total
+    paths length: os.path.join -> {os: {os.path: {os.path.join: {}}}}
+    """
+    tree = {}
+    for path in paths:
+        node = tree
+        end = path.find(".")
+        while end != -1:
+            node = node.setdefault(path[:end], {})
+            end = path.find(".", end + 1)
+        node.setdefault(path, {})
+    return tree
+
+
+def truncate(node: dict, depth: int) -> dict:
+    """Copy of the tree cut after depth levels"""
+    if depth <= 0:
+        return {}
+    return {key: truncate(child, depth - 1) for key, child in node.items()}
+
+
+def dump_tree(tree: dict) -> bytes:
+    """
+    JSON of a tree, serialized one top level branch at a time. The encoder
+    holds the GIL for a whole call, so a big tree serialized at once in a
+    worker thread would still stall the event loop.
+    """
+    branches = (
+        f"{json.dumps(key)}:{json.dumps(child, separators=(',', ':'))}"
+        for key, child in tree.items()
+    )
+    return ("{" + ",".join(branches) + "}").encode("utf-8")
+
+
+def encode(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=9)
+    if encoding == "gzip":
+        return gzip.compress(body, compresslevel=9)
+    return body
+
+
+class BodyCache:
+    """
+    Least recently used bodies, bounded by their total size instead of their
+    count: a few full trees weigh as much as thousands of small branches.
+    Thread safe, the bodies are built in the executor threads.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.bodies: OrderedDict[Hashable, bytes | None] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: Hashable, build: Callable[[], bytes | None]) -> bytes | None:
+        with self.lock:
+            if key in self.bodies:
+                self.bodies.move_to_end(key)
+                return self.bodies[key]
+        body = build()
+        size = len(body) if body else 0
+        if size > self.max_bytes:
+            return body
+        with self.lock:
+            if key not in self.bodies:
+                self.bodies[key] = body
+                self.size += size
+            while self.size > self.max_bytes:
+                _, evicted = self.bodies.popitem(last=False)
+                self.size -= len(evicted) if evicted else 0
+        return body
+
+
+class PathIndex:
+    """Distinct module paths of the calls, sorted and as a tree of prefixes"""
+
+    # Ranked completions of prefixes matching fewer paths are computed exactly
+    RANK_SCAN_LIMIT = 20000
+    # Most used paths, searched first for ranked completions of broad prefixes
+    POPULAR_SIZE = 100000
+
+    def __init__(
+        self,
+        paths: Iterable[str],
+        counts: dict[str, int | None] | None = None,
+        cache_bytes: int = 256 * 1024**2,
+    ) -> None:
+        """
+        :param paths: Distinct module paths of the calls.
+        :param counts: Usage count of the paths, to rank the completions. Paths
+                       without a count are not ranked.
+        :param cache_bytes: Total size of the serialized bodies kept.
+        """
+        self.paths = sorted(set(paths))
+        self.counts = {path: count for path, count in (counts or {}).items() if count}
+        self.version = sha1("\n".join(self.paths).encode("utf-8")).hexdigest()
+        self.tree = build_tree(self.paths)
+        # Levels of the tree, deeper depths give the same bodies as no depth
+        self.height = max((path.count(".") + 1 for path in self.paths), default=0)
+        self.popular = heapq.nsmallest(
+            self.POPULAR_SIZE, self.counts, key=lambda path: (-self.counts[path], path)
+        )
+        # Bodies only change with the index, so they're serialized once per version
+        self.bodies = BodyCache(cache_bytes)
+
+    def _count(self, path: str) -> int:
+        return self.counts.get(path, 0)
+
+    def complete(self, prefix: str, limit: int = 10, rank: bool = False) -> list[str]:
+        """
+        Get the paths starting with the prefix, with a binary search of the
+        sorted paths.
+
+        :param rank: Sort them by usage count instead of alphabetically.
+        """
+        start = bisect_left(self.paths, prefix)
+        end = bisect_left(self.paths, prefix + chr(0x10FFFF), start)
+        if not rank or not self.counts:
+            return self.paths[start : min(end, start + limit)]
+        if end - start <= self.RANK_SCAN_LIMIT:
+            return heapq.nlargest(limit, self.paths[start:end], key=self._count)
+        # Broad prefix, the most used paths that match are the answer if there
+        # are enough of them as every other path is used less
+        matches = []
+        for path in self.popular:
+            if path.startswith(prefix):
+                matches.append(path)
+                if len(matches) == limit:
+                    return matches
+        return heapq.nlargest(limit, self.paths[start:end], key=self._count)
+
+    def top(self, prefix: str = "", limit: int = 10) -> list[tuple[str, int]]:
+        """Get the most used paths under a module path prefix with their count"""
+        if not prefix:
+            paths = self.popular[:limit]
+        else:
+            paths = self.complete(prefix + ".", limit, rank=True)
+            if prefix in self.counts:
+                paths = heapq.nlargest(limit, [prefix, *paths], key=self._count)
+        return [(path, self._count(path)) for path in paths]
+
+    def find(self, prefix: str) -> dict | None:
+        """Get the children of a path prefix, None if it's not in the tree"""
+        node = self.tree
+        end = prefix.find(".")
+        while node is not None and end != -1:
+            node = node.get(prefix[:end])
+            end = prefix.find(".", end + 1)
+        return node.get(prefix) if node is not None else None
+
+    def subtree(self, prefix: str = "", depth: int | None = None) -> dict | None:
+        """
+        Get the branch of a prefix, the whole tree when empty.
+
+        :param depth: Levels of descendants to include, all of them when None.
+        """
+        node = self.find(prefix) if prefix else self.tree
+        if node is None:
+            return None
+        if depth is not None:
+            node = truncate(node, depth)
+        return {prefix: node} if prefix else node
+
+    def normalize_depth(self, depth: int | None) -> int | None:
+        """
+        Maps every depth reaching the leaves to None, so clients can't make a
+        new body of the same tree for every depth
+        """
+        return None if depth is not None and depth >= self.height else depth
+
+    def etag(self, prefix: str, depth: int | None, encoding: str) -> str:
+        """Strong ETag of a subtree representation for this index version"""
+        depth = self.normalize_depth(depth)
+        key = f"{self.version}\0{prefix}\0{depth}\0{encoding}"
+        return f'"{sha1(key.encode("utf-8")).hexdigest()}"'
+
+    def encoded(self, prefix: str, depth: int | None, encoding: str) -> bytes | None:
+        """Serialized and compressed subtree, None if the prefix is not in the tree"""
+        depth = self.normalize_depth(depth)
+        return self.bodies.get(
+            (prefix, depth, encoding), lambda: self._encoded(prefix, depth, encoding)
+        )
+
+    def _encoded(self, prefix: str, depth: int | None, encoding: str) -> bytes | None:
+        subtree = self.subtree(prefix, depth)
+        if subtree is None:
+            return None
+        return encode(dump_tree(subtree), encoding)
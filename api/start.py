@@ -1,82 +1,290 @@
+import asyncio
 import logging
 import os
+import time
 
-from fastapi import Depends, FastAPI, Response, status, Query
+from fastapi import Depends, FastAPI, HTTPException, Request, Response, status, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 
+from cache import ResultCache
 from config import set_logger
-from models import Call, Message
-from exceptions import TableNotFound
+from models import BatchError, BatchRequest, BatchResult, CacheStats, Call, Message, PathCount
+from path_index import ENCODINGS, PathIndex
+from exceptions import InvalidCursor, TableNotFound
 from db.dynamo import Dynamo
+from db.sqlite import SQLite
+from db.storage import Storage
+import metrics
 
 # ENVS
 aws_region = os.getenv("AWSREGION")
 aws_access_key_id = os.getenv("AWSACCESSKEY")
 aws_secret_access_key = os.getenv("AWSSECRETACCESSKEY")
 aws_endpoint = os.getenv("AWSENDPOINT")
+storage = os.getenv("STORAGE", "dynamo")
+sqlite_path = os.getenv("SQLITEPATH", "calls.db")
+db_pool_size = int(os.getenv("DBPOOLSIZE", 50))
+cache_size = int(os.getenv("CACHESIZE", 10000))
+cache_ttl = float(os.getenv("CACHETTL", 300))
+tree_cache_bytes = int(os.getenv("TREECACHEBYTES", 256 * 1024**2))
+# Seconds between reloads of the module paths and their counts, 0 disables them
+index_refresh = float(os.getenv("INDEXREFRESH", 300))
 
 set_logger()
 logger = logging.getLogger(__name__)
 
 
-def get_db():
-    db = Dynamo(aws_region, aws_access_key_id, aws_secret_access_key, aws_endpoint)
-    return db
+def get_db(request: Request) -> Storage:
+    return request.app.state.db
 
 
 app = FastAPI()
+app.state.cache = ResultCache(cache_size, cache_ttl)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=['*'],
-    allow_methods=["GET"],
+    allow_methods=["GET", "POST"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 
+@app.middleware("http")
+async def record_latency(request: Request, call_next):
+    start = time.perf_counter()
+    status_code = status.HTTP_500_INTERNAL_SERVER_ERROR
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Labeled by route template, not by path, to bound the number of series
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        metrics.REQUEST_DURATION.observe(
+            time.perf_counter() - start,
+            method=request.method,
+            route=route,
+            status=status_code,
+        )
+
+
 @app.on_event("startup")
 async def startup_event():
-    db = Dynamo(aws_region, aws_access_key_id, aws_secret_access_key, aws_endpoint)
-    if not db.list_tables():
+    if storage == "sqlite":
+        db = SQLite(sqlite_path, db_pool_size)
+    else:
+        db = Dynamo(
+            aws_region,
+            aws_access_key_id,
+            aws_secret_access_key,
+            aws_endpoint,
+            pool_size=db_pool_size,
+        )
+    tables = db.list_tables()
+    if not tables:
         raise TableNotFound()
-    key_list = sorted(list(db.call_table.get_partition_keys()))
-    keys = dict()
-    while key_list:
-        path = key_list.pop(0)
-        keys = tree_insert(path.split('.'), keys)
-    logger.info("Database ready")
-    app.state.path_keys = keys
-
-def tree_insert(path: list, tree: dict):
-    aux_tree = tree
-    for i, key in enumerate(path):
-        key_name = key
-        if key not in aux_tree:
-            key_name = '.'.join(path[0: i + 1])
-            aux_tree[key_name] = {}
-        aux_tree = aux_tree[key_name]
-    return tree
+    path_index = load_path_index(db, tables)
+    logger.info(f"Database ready, {len(path_index.paths)} module paths")
+    app.state.db = db
+    app.state.path_index = path_index
+    if index_refresh > 0:
+        app.state.index_refresh = asyncio.create_task(refresh_path_index(db))
+
+
+def load_path_index(db: Storage, tables: list[str], previous: PathIndex | None = None) -> PathIndex:
+    """Builds the index of the module paths with their current counts"""
+    # Usage count by module path, None when the index of the paths is missing
+    module_paths = db.get_module_paths(tables)
+    path_index = PathIndex(
+        paths=module_paths.keys(), counts=module_paths, cache_bytes=tree_cache_bytes
+    )
+    if previous is not None and previous.version == path_index.version:
+        # Same paths, the tree bodies don't depend on the counts
+        path_index.bodies = previous.bodies
+    # Serializes the whole tree once instead of on every request
+    path_index.encoded("", None, "gzip")
+    return path_index
+
+
+async def refresh_path_index(db: Storage) -> None:
+    """
+    The scraper keeps writing after startup, so the paths of the tree and
+    autocomplete and the counts of the popular paths are reloaded every
+    index_refresh seconds. They're built in the default executor and swapped
+    at once, requests in between are answered by the previous index.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(index_refresh)
+        previous = app.state.path_index
+        try:
+            # The index of the paths may have been created since
+            app.state.path_index = await loop.run_in_executor(
+                None, lambda: load_path_index(db, db.list_tables(), previous)
+            )
+        except Exception as ex:
+            logger.error(f"Couldn't refresh the module paths: {ex}")
+
+
+def accepted_encoding(accept_encoding: str) -> str:
+    """Get the best encoding of the tree bodies the client accepts"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        encoding, _, params = part.partition(";")
+        if params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(encoding.strip())
+    return next((encoding for encoding in ENCODINGS if encoding in accepted), "identity")
+
+
+async def tree_response(request: Request, prefix: str, depth: int | None) -> Response:
+    """
+    Pre-serialized and compressed subtree with a strong ETag, answers with a
+    304 if the client already has it. Bodies missing from the cache are built
+    in the default executor, serializing and compressing a big tree takes
+    seconds that would stall every other request on the event loop.
+    """
+    path_index: PathIndex = app.state.path_index
+    encoding = accepted_encoding(request.headers.get("accept-encoding", ""))
+    etag = path_index.etag(prefix, depth, encoding)
+    headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in (tag.strip() for tag in if_none_match.split(",")):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    loop = asyncio.get_running_loop()
+    body = await loop.run_in_executor(None, path_index.encoded, prefix, depth, encoding)
+    if body is None:
+        raise HTTPException(status.HTTP_404_NOT_FOUND, f"{prefix} not found")
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(body, media_type="application/json", headers=headers)
 
 
 @app.get("/", status_code=200)
 async def home() -> Message:
     return Message(message="Try with a python module path!")
 
+async def get_calls(
+    db: Storage,
+    module_path: str,
+    page_number: int,
+    page_size: int,
+    cursor: str | None = None,
+) -> tuple[list[dict], str | None]:
+    """Get a page of calls and the cursor of the next one through the cache"""
+    async def load_calls():
+        if page_number and not cursor:
+            # Compatibility path, reads every previous page
+            calls = await db.call_table.get_calls_async(module_path, page_number, page_size)
+            return calls, None
+        return await db.call_table.get_calls_page_async(module_path, page_size, cursor)
+
+    page = cursor or page_number
+    return await app.state.cache.get((module_path, page, page_size), load_calls)
+
+@app.get("/calls/tree")
+async def path_subtree(
+    request: Request,
+    prefix: str = Query("", description="Dotted path of the branch, the root when empty"),
+    depth: int | None = Query(None, ge=0, description="Levels of descendants to include"),
+) -> Response:
+    return await tree_response(request, prefix, depth)
+
+@app.get("/calls/autocomplete")
+async def path_autocomplete(
+    q: str = Query(..., min_length=1, description="Start of the module path"),
+    limit: int = Query(10, ge=1, le=100),
+    rank: bool = Query(False, description="Most used paths first"),
+) -> list[str]:
+    """Paths and counts as of the last refresh of the index, see INDEXREFRESH"""
+    return app.state.path_index.complete(q, limit, rank)
+
+@app.get("/calls/popular")
+async def popular_paths(
+    prefix: str = Query("", description="Module path, every path when empty"),
+    limit: int = Query(20, ge=1, le=100),
+) -> list[PathCount]:
+    """
+    Counts as of the last refresh of the index, see INDEXREFRESH. The count
+    of a single path is current.
+    """
+    return [
+        PathCount(path=path, count=count)
+        for path, count in app.state.path_index.top(prefix, limit)
+    ]
+
+@app.get("/calls/{module_path}/count")
+async def module_count(module_path: str, db: Storage = Depends(get_db)) -> PathCount:
+    count = await app.state.cache.get(
+        ("count", module_path), lambda: db.path_table.get_count_async(module_path)
+    )
+    return PathCount(path=module_path, count=count)
+
+@app.post("/calls/batch")
+async def batch_calls(batch: BatchRequest, db: Storage = Depends(get_db)) -> StreamingResponse:
+    """
+    Queries the first calls of every path concurrently, each path result is
+    streamed as a JSON line as soon as it's ready. The headers are sent with
+    the first line, so a failed path is answered with an error line instead
+    of cutting the stream of the others.
+    """
+    async def get_path_calls(path: str) -> BatchResult | BatchError:
+        try:
+            calls, _ = await get_calls(db, path, 0, batch.limit)
+        except Exception as ex:
+            logger.error(f"Couldn't get the calls of {path} in a batch: {ex}")
+            return BatchError(path=path, error=str(ex))
+        return BatchResult(path=path, calls=calls)
+
+    tasks = [asyncio.ensure_future(get_path_calls(path)) for path in dict.fromkeys(batch.paths)]
+
+    async def results():
+        try:
+            for task in asyncio.as_completed(tasks):
+                result = await task
+                yield result.json() + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
 @app.get("/calls/{module_path}")
 async def module_calls(
     module_path: str,
     response: Response,
     page_number: int = Query(0, ge=0),
     page_size: int = Query(20, ge=1, le=100),
-    db: Dynamo = Depends(get_db),
+    cursor: str | None = Query(None, description="X-Next-Cursor of the previous page"),
+    db: Storage = Depends(get_db),
 ) -> list[Call] | None:
-    calls = db.call_table.get_calls(module_path, page_number, page_size)
+    try:
+        calls, next_cursor = await get_calls(db, module_path, page_number, page_size, cursor)
+    except InvalidCursor as ex:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, str(ex))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
     response.status_code = status.HTTP_200_OK if calls else status.HTTP_204_NO_CONTENT
     return calls
 
 @app.get("/calls")
-async def module_calls() -> dict[str, dict] | None:
-    return app.state.path_keys
+async def path_tree(request: Request) -> Response:
+    return await tree_response(request, "", None)
+
+@app.get("/cache/stats")
+async def cache_stats() -> CacheStats:
+    return CacheStats(**app.state.cache.stats())
+
+@app.get("/metrics")
+async def prometheus_metrics() -> PlainTextResponse:
+    return PlainTextResponse(
+        metrics.render(app.state.cache.stats()), media_type=metrics.CONTENT_TYPE
+    )
 
 @app.on_event("shutdown")
 def shutdown_event():
     logger.info("Shutting down")
+    if hasattr(app.state, "index_refresh"):
+        app.state.index_refresh.cancel()
+    if hasattr(app.state, "db"):
+        app.state.db.close()
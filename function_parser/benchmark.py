@@ -0,0 +1,206 @@
+"""
+Offline benchmark of RepoParser over a generated or local corpus, no network
+or database needed.
+
+    $ python benchmark.py --files 2000 --workers 4 --output bench.json
+    $ python benchmark.py --baseline bench.json
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from config import set_logger
+from models.file import File
+from models.folder import Folder
+from models.repository import Repository
+from repo_parser import RepoParser
+
+set_logger()
+logger = logging.getLogger(__name__)
+
+MODULES = ("os", "os.path", "json", "re", "requests", "numpy", "collections", "typing")
+NAMES = ("get", "join", "loads", "dumps", "compile", "array", "Session", "defaultdict")
+
+# Higher is better for these metrics, lower for the rest
+THROUGHPUT_METRICS = ("files_per_second", "calls_per_second")
+
+
+def generate_source(rng: random.Random, functions: int) -> str:
+    """Python module with imports, classes and calls like the ones of real repositories"""
+    lines = [f"import {module}" for module in rng.sample(MODULES, 3)]
+    lines += [
+        f"from {rng.choice(MODULES)} import {name} as {name}_{i}"
+        for i, name in enumerate(rng.sample(NAMES, 3))
+    ]
+    lines.append("from . import local_module")
+    lines.append("")
+    for i in range(functions):
+        if i % 5 == 0:
+            lines.append(f"class Handler{i}(requests.Session):")
+            lines.append("    def __init__(self, *args):")
+            lines.append("        super().__init__(*args)")
+            lines.append("        self.data = {}")
+        lines.append(f"def function_{i}(value):")
+        lines.append("    import collections")
+        for j in range(rng.randint(3, 12)):
+            module = rng.choice(MODULES)
+            name = rng.choice(NAMES)
+            lines.append(f"    result_{j} = {module}.{name}(value, len(str(value)))")
+        lines.append("    local_module.run(value)")
+        lines.append("    return collections.Counter(value)")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def generate_repository(files: int, functions: int, seed: int) -> Repository:
+    """Synthetic repository with nested packages, deterministic for a seed"""
+    rng = random.Random(seed)
+    root = Folder("synthetic-main", [])
+    packages = [root]
+    for i in range(files):
+        if i % 20 == 0:
+            package = Folder(f"package_{i // 20}", [])
+            rng.choice(packages).files.append(package)
+            packages.append(package)
+        data = generate_source(rng, functions).encode("utf-8")
+        name = f"module_{i}.py"
+        packages[-1].files.append(File(name, f"synthetic/{name}", data, path=f"{i}/{name}"))
+    return Repository(0, "synthetic", "benchmark", "", "", "Python", "main", root)
+
+
+def load_repository(path: str) -> Repository:
+    """Repository with the python files of a local directory, read into memory"""
+    root = Folder(os.path.basename(os.path.abspath(path)), [])
+    folders = {os.path.abspath(path): root}
+    for directory, dir_names, file_names in os.walk(path):
+        directory = os.path.abspath(directory)
+        folder = folders[directory]
+        for dir_name in sorted(dir_names):
+            folders[os.path.join(directory, dir_name)] = child = Folder(dir_name, [])
+            folder.files.append(child)
+        for file_name in sorted(file_names):
+            if file_name.endswith(".py"):
+                file_path = os.path.join(directory, file_name)
+                with open(file_path, "rb") as file:
+                    data = file.read()
+                relative = os.path.relpath(file_path, path)
+                folder.files.append(File(file_name, file_path, data, path=relative))
+    return Repository(0, root.name, "local", "", "", "Python", "main", root)
+
+
+def percentile(values: list[float], percent: float) -> float:
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def run(repo: Repository, workers: int, repeat: int) -> dict:
+    files = [file for file in repo.directory.walk(File) if file.has_source]
+    total_bytes = sum(len(file.read()) for file in files)
+
+    parser = RepoParser(repo)
+    file_times = []
+    for file in files:
+        start = time.perf_counter()
+        parser.get_file_calls(file)
+        file_times.append(time.perf_counter() - start)
+
+    best = None
+    calls = 0
+    executor = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            calls = len(RepoParser(repo, executor).get_repo_calls())
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    # Apart from the timings, tracing allocations slows everything down
+    tracemalloc.start()
+    RepoParser(repo).get_repo_calls()
+    _, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "files": len(files),
+        "bytes": total_bytes,
+        "calls": calls,
+        "workers": workers,
+        "seconds": round(best, 4),
+        "files_per_second": round(len(files) / best, 1),
+        "calls_per_second": round(calls / best, 1),
+        "file_p50_ms": round(percentile(file_times, 50) * 1000, 3),
+        "file_p99_ms": round(percentile(file_times, 99) * 1000, 3),
+        "peak_memory_mb": round(peak_memory / 1024**2, 2),
+    }
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list[str]:
+    """Get the metrics that got worse than the baseline by more than threshold"""
+    regressions = []
+    for metric in (*THROUGHPUT_METRICS, "file_p99_ms", "peak_memory_mb"):
+        old, new = baseline["results"].get(metric), result.get(metric)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        worse = -change if metric in THROUGHPUT_METRICS else change
+        status = "REGRESSION" if worse > threshold else "ok"
+        logger.info(f"{metric:>18}: {old:>12} -> {new:>12} ({change:+.1%}) {status}")
+        if worse > threshold:
+            regressions.append(metric)
+    return regressions
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--corpus", help="Local directory to parse instead of a generated repository")
+    arg_parser.add_argument("--files", type=int, default=1000, help="Generated files")
+    arg_parser.add_argument("--functions", type=int, default=20, help="Functions per generated file")
+    arg_parser.add_argument("--seed", type=int, default=0)
+    arg_parser.add_argument("--workers", type=int, default=1, help="Parser processes, 1 parses serially")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="Runs of get_repo_calls, the best one is kept")
+    arg_parser.add_argument("--output", help="Saves the results to this JSON file")
+    arg_parser.add_argument("--baseline", help="JSON results to compare with")
+    arg_parser.add_argument("--threshold", type=float, default=0.1, help="Allowed regression, 0.1 is 10%%")
+    args = arg_parser.parse_args()
+
+    if args.corpus:
+        repo = load_repository(args.corpus)
+    else:
+        repo = generate_repository(args.files, args.functions, args.seed)
+    results = run(repo, args.workers, args.repeat)
+    for metric, value in results.items():
+        logger.info(f"{metric:>18}: {value}")
+
+    report = {
+        "corpus": args.corpus or f"generated files={args.files} functions={args.functions} seed={args.seed}",
+        "python": platform.python_version(),
+        "cpus": os.cpu_count(),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        if baseline.get("corpus") != report["corpus"]:
+            logger.warning(f"Baseline corpus differs: {baseline.get('corpus')}")
+        if compare(results, baseline, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from itertools import islice
+from typing import Callable, Iterable, Iterator
+
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+from exceptions import UnprocessedItems
+
+logger = logging.getLogger(__name__)
+
+THROTTLING_ERRORS = {
+    "ProvisionedThroughputExceededException",
+    "ThrottlingException",
+    "RequestLimitExceeded",
+}
+
+
+@dataclass
+class WriteStats:
+    items: int = 0
+    consumed_wcu: float = 0
+    throttles: int = 0
+    seconds: float = 0
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds else 0
+
+    @property
+    def wcu_per_second(self) -> float:
+        return self.consumed_wcu / self.seconds if self.seconds else 0
+
+
+class AdaptiveLimiter:
+    """
+    Limits the requests in flight, the limit grows by one every limit
+    successful requests and halves on throttling (AIMD)
+    """
+
+    def __init__(self, minimum: int, maximum: int) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(maximum)
+        self.active = 0
+        self.condition = threading.Condition()
+
+    def acquire(self) -> None:
+        with self.condition:
+            while self.active >= int(self.limit):
+                self.condition.wait()
+            self.active += 1
+
+    def release(self, throttled: bool) -> None:
+        with self.condition:
+            self.active -= 1
+            if throttled:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self.condition.notify_all()
+
+
+class ClientPool:
+    """
+    Threads sending the write requests, created once and shared by the tables.
+    Every thread creates its own client on its first request and keeps it, so
+    there is one client per worker for the whole run.
+    """
+
+    def __init__(self, client_factory: Callable[[], object], max_workers: int = 16) -> None:
+        """
+        :param client_factory: Creates a Boto3 DynamoDB client.
+        """
+        self.client_factory = client_factory
+        self.max_workers = max(max_workers, 1)
+        self.executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="dynamodb")
+        self.local = threading.local()
+
+    def client(self):
+        """Get the client of the current worker"""
+        client = getattr(self.local, "client", None)
+        if client is None:
+            client = self.local.client = self.client_factory()
+        return client
+
+    def submit(self, function: Callable, *args) -> Future:
+        return self.executor.submit(function, *args)
+
+    def map(self, function: Callable, items: Iterable) -> Iterator:
+        return self.executor.map(function, items)
+
+    def close(self) -> None:
+        self.executor.shutdown()
+
+
+class BulkWriter:
+    """
+    Writes to a table with full BatchWriteItem requests from a pool of threads,
+    each one with its own client. Unprocessed items and throttled requests are
+    retried with jittered exponential backoff while the concurrency adapts to
+    the table capacity.
+    """
+
+    MAX_BATCH_SIZE = 25
+
+    def __init__(
+        self,
+        pool: ClientPool,
+        table_name: str,
+        min_workers: int = 1,
+        max_attempts: int = 10,
+        base_delay: float = 0.05,
+        max_delay: float = 5,
+    ) -> None:
+        """
+        :param pool: Threads sending the requests, at most one per thread in flight.
+        """
+        self.pool = pool
+        self.table_name = table_name
+        self.max_workers = pool.max_workers
+        self.limiter = AdaptiveLimiter(max(min_workers, 1), self.max_workers)
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.serializer = TypeSerializer()
+        self.lock = threading.Lock()
+        self.stats = WriteStats()
+
+    def _serialize(self, item: dict) -> dict:
+        return {key: self.serializer.serialize(value) for key, value in item.items()}
+
+    def put(self, items: Iterable[dict]) -> WriteStats:
+        return self.write(
+            {"PutRequest": {"Item": self._serialize(item)}} for item in items
+        )
+
+    def delete(self, keys: Iterable[dict]) -> WriteStats:
+        return self.write(
+            {"DeleteRequest": {"Key": self._serialize(key)}} for key in keys
+        )
+
+    def write(self, requests: Iterable[dict]) -> WriteStats:
+        """
+        Sends the write requests in batches of 25.
+
+        :return: The stats of this write.
+        """
+        stats = WriteStats()
+        start = time.perf_counter()
+        requests = iter(requests)
+        pending: set[Future] = set()
+        try:
+            while batch := list(islice(requests, self.MAX_BATCH_SIZE)):
+                pending.add(self.pool.submit(self._write_batch, batch))
+                if len(pending) < 2 * self.max_workers:
+                    continue
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._add_stats(stats, future.result())
+            for future in pending:
+                self._add_stats(stats, future.result())
+        finally:
+            # The pool outlives the write, a failed write doesn't leave work behind
+            for future in pending:
+                future.cancel()
+            wait(pending)
+        stats.seconds = time.perf_counter() - start
+        with self.lock:
+            self.stats.seconds += stats.seconds
+        logger.info(
+            f"Wrote {stats.items} items to {self.table_name} in {stats.seconds:.1f}s "
+            f"({stats.items_per_second:.0f} items/s, {stats.consumed_wcu:.0f} WCU, "
+            f"{stats.wcu_per_second:.0f} WCU/s, {stats.throttles} throttles)"
+        )
+        return stats
+
+    def _add_stats(self, stats: WriteStats, batch_stats: WriteStats) -> None:
+        for total in (stats, self.stats):
+            with self.lock:
+                total.items += batch_stats.items
+                total.consumed_wcu += batch_stats.consumed_wcu
+                total.throttles += batch_stats.throttles
+
+    def backoff(self, attempt: int) -> None:
+        """Sleeps a random time up to the exponential delay of the attempt"""
+        time.sleep(random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt)))
+
+    def _write_batch(self, batch: list[dict]) -> WriteStats:
+        stats = WriteStats(items=len(batch))
+        client = self.pool.client()
+        request = {self.table_name: batch}
+        for attempt in range(self.max_attempts):
+            self.limiter.acquire()
+            throttled = False
+            try:
+                response = client.batch_write_item(
+                    RequestItems=request, ReturnConsumedCapacity="TOTAL"
+                )
+            except ClientError as err:
+                if err.response["Error"]["Code"] not in THROTTLING_ERRORS:
+                    self.limiter.release(False)
+                    raise
+                throttled = True
+            else:
+                stats.consumed_wcu += sum(
+                    capacity.get("CapacityUnits", 0)
+                    for capacity in response.get("ConsumedCapacity", [])
+                )
+                request = response.get("UnprocessedItems") or {}
+                throttled = bool(request)
+            self.limiter.release(throttled)
+            if not request:
+                return stats
+            stats.throttles += 1
+            self.backoff(attempt)
+        raise UnprocessedItems(
+            f"{len(request.get(self.table_name, []))} items not written to {self.table_name}"
+        )
@@ -1,11 +1,12 @@
 import logging
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
+from typing import Iterable
 from models.call import Call as ModelCall
 
-from boto3.dynamodb.conditions import Key
 from botocore.exceptions import ClientError
 
+from .bulk_writer import BulkWriter, ClientPool
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,16 +17,36 @@ class CallDTO:
     line_number: int
     file_name: str
     url: str
+    snippet: bytes | None = None
+
+
+def to_call_dto(call: ModelCall) -> CallDTO:
+    """Item of a parsed call, the same in every backend"""
+    return CallDTO(
+        call.hex_id,
+        call.path,
+        call.line_number,
+        call.file.name,
+        call.file.web_url,
+        call.snippet,
+    )
 
 
 class Call:
-    def __init__(self, dyn_client, table_name: str):
+    def __init__(
+        self,
+        dyn_client,
+        table_name: str,
+        pool: ClientPool,
+    ):
         """
         :param dyn_resource: A Boto3 DynamoDB resource.
+        :param pool: Writer threads, their count is the max concurrent BatchWriteItem requests.
         """
         self.table_name = table_name
         self.dyn_resource = dyn_client
         self.table = self._get_table()
+        self.writer = BulkWriter(pool, table_name)
 
     def create_table(self):
         """
@@ -74,71 +95,40 @@ class Call:
             )
             raise
 
-    def write_batch_threaded(self, calls: set[ModelCall] | list[ModelCall]):
+    def write_batch(self, calls: Iterable[ModelCall]):
         """
-        Fills an Amazon DynamoDB table with the specified data, using the Boto3
-        Table.batch_writer() function to put the items in the table.
-        Inside the context manager, Table.batch_writer builds a list of
-        requests. On exiting the context manager, Table.batch_writer starts sending
-        batches of write requests to Amazon DynamoDB and automatically
-        handles chunking, buffering, and retrying. Uses ThreadPoolExecutor
-
-        :param calls: The data to put in the table. Each item must contain at least
-                       the keys required by the schema that was specified when the
-                       table was created.
+        Fills an Amazon DynamoDB table with the specified data using the
+        BulkWriter, which sends full BatchWriteItem requests from a pool of
+        threads and retries the unprocessed items.
+
+        :param calls: The data to put in the table.
         """
         try:
-            logger.info(f"Writing batch with {len(calls)} calls")
-            calls = list(calls)
-            BATCHSIZE = 10
-            sub_batches = [
-                calls[i : i + BATCHSIZE] for i in range(0, len(calls), BATCHSIZE)
-            ]
-            with ThreadPoolExecutor(BATCHSIZE) as executor:
-                futures = [
-                    executor.submit(self._write_batch, sub_batch)
-                    for sub_batch in sub_batches
-                ]
-                for future in as_completed(futures):
-                    future.result()
-            logger.info("Inserted batch!")
+            return self.writer.put(
+                {key: value for key, value in vars(to_call_dto(call)).items() if value is not None}
+                for call in calls
+            )
         except ClientError as err:
             logger.critical(
                 "Couldn't load data into table %s. Here's why: %s: %s",
-                self.table.name,
+                self.table_name,
                 err.response["Error"]["Code"],
                 err.response["Error"]["Message"],
             )
             raise
 
-    def _write_batch(self, calls: set[ModelCall] | list[ModelCall]):
+    def delete_batch(self, keys: set[tuple[str, str]]):
         """
-        Fills an Amazon DynamoDB table with the specified data, using the Boto3
-        Table.batch_writer() function to put the items in the table.
-        Inside the context manager, Table.batch_writer builds a list of
-        requests. On exiting the context manager, Table.batch_writer starts sending
-        batches of write requests to Amazon DynamoDB and automatically
-        handles chunking, buffering, and retrying.
-
-        :param calls: The data to put in the table. Each item must contain at least
-                       the keys required by the schema that was specified when the
-                       table was created.
+        Deletes calls from the table.
+
+        :param keys: The (path_, id) keys of the calls.
         """
         try:
-            with self.table.batch_writer() as writer:
-                for call in calls:
-                    dto = CallDTO(
-                        call.id,
-                        call.path,
-                        call.line_number,
-                        call.file.name,
-                        call.file.web_url,
-                    )
-                    writer.put_item(Item=vars(dto))
+            return self.writer.delete({"path_": path, "id": id_} for path, id_ in keys)
         except ClientError as err:
             logger.critical(
-                "Couldn't load data into table %s. Here's why: %s: %s",
-                self.table.name,
+                "Couldn't delete data from table %s. Here's why: %s: %s",
+                self.table_name,
                 err.response["Error"]["Code"],
                 err.response["Error"]["Message"],
             )
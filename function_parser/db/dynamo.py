@@ -1,17 +1,28 @@
 import logging
+from contextlib import nullcontext
 
 import boto3
 from botocore.exceptions import ClientError
 
+from .bulk_writer import ClientPool
 from .call import Call
+from .file import File
+from .path import Path
+from .repository import Repository
 
 logger = logging.getLogger(__name__)
 
 CALLTABLENAME = "calls"
+REPOSITORYTABLENAME = "repositories"
+FILETABLENAME = "files"
+PATHTABLENAME = "paths"
 
 
 class Dynamo:
     call_table: Call
+    repository_table: Repository
+    file_table: File
+    path_table: Path
 
     def __init__(
         self,
@@ -19,8 +30,15 @@ class Dynamo:
         aws_access_key_id: str,
         aws_secret_access_key: str,
         aws_endpoint: str,
-        init_tables=False
+        init_tables=False,
+        max_write_workers: int = 16,
     ) -> None:
+        self.client_kwargs = dict(
+            region_name=aws_region,
+            aws_access_key_id=aws_access_key_id,
+            aws_secret_access_key=aws_secret_access_key,
+            endpoint_url=aws_endpoint or None,
+        )
         self.resource = boto3.resource(
             "dynamodb",
             region_name=aws_region,
@@ -28,14 +46,44 @@ class Dynamo:
             aws_secret_access_key=aws_secret_access_key,
             endpoint_url=aws_endpoint or None,
         )
-        self.call_table = Call(self.resource, CALLTABLENAME)
+        # Shared by the writes of every table for the whole run
+        self.pool = ClientPool(self.new_client, max_write_workers)
+        self.call_table = Call(self.resource, CALLTABLENAME, self.pool)
+        self.repository_table = Repository(self.resource, REPOSITORYTABLENAME)
+        self.file_table = File(self.resource, FILETABLENAME, self.pool)
+        self.path_table = Path(self.resource, PATHTABLENAME, self.pool)
         if init_tables:
             logger.info("Starting DB")
             self.init_tables()
 
+    def new_client(self):
+        """
+        Creates a low level client with its own session, clients are not shared
+        between threads.
+        """
+        return boto3.session.Session().client("dynamodb", **self.client_kwargs)
+
     def init_tables(self):
-        if not self.exists(CALLTABLENAME):
+        tables = self.list_tables()
+        if CALLTABLENAME not in tables:
             self.call_table.create_table()
+        if REPOSITORYTABLENAME not in tables:
+            self.repository_table.create_table()
+        if FILETABLENAME not in tables:
+            self.file_table.create_table()
+        if PATHTABLENAME not in tables:
+            self.path_table.create_table()
+
+    def transaction(self):
+        """
+        DynamoDB can't hold the batch writes of the tables in a transaction,
+        the writes of the block are applied one by one
+        """
+        return nullcontext()
+
+    def close(self):
+        """Stops the writer threads, once nothing else is written"""
+        self.pool.close()
 
     def list_tables(self) -> list[str]:
         """
@@ -0,0 +1,278 @@
+import logging
+from dataclasses import dataclass
+from typing import Iterator
+
+from boto3.dynamodb.conditions import Key
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+from exceptions import UnprocessedItems
+
+from .bulk_writer import BulkWriter, ClientPool
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class FileDTO:
+    repo_id: str
+    file_path: str
+    blob_hash: str
+    # [path_, id] keys of the file calls in the calls table
+    call_keys: list[list[str]]
+
+
+class File:
+    """
+    DynamoDB items are limited to 400 KB, so the call keys of a big file are
+    split in parts. The file item keeps the first one and the number of the
+    others, which are items of their own keyed by the file path and their
+    number. Parts can't collide with a file, git paths never have "//".
+    The batch reads and writes go through the clients of the pool, the
+    resource is not shared between threads.
+    """
+
+    BATCH_GET_SIZE = 100
+    MAX_KEYS_SIZE = 256 * 1024
+    PART_SEPARATOR = "//"
+
+    def __init__(self, dyn_client, table_name: str, pool: ClientPool):
+        """
+        :param dyn_resource: A Boto3 DynamoDB resource.
+        :param pool: Writer threads, shared with the other tables.
+        """
+        self.table_name = table_name
+        self.dyn_resource = dyn_client
+        self.table = self._get_table()
+        self.pool = pool
+        self.writer = BulkWriter(pool, table_name)
+        self.serializer = TypeSerializer()
+        self.deserializer = TypeDeserializer()
+
+    def create_table(self):
+        """
+        Creates an Amazon DynamoDB table that stores the content hash and the
+        call keys of every indexed file. The table uses the repository full name
+        as the partition key and the file path as the sort key.
+        """
+        try:
+            self.table = self.dyn_resource.create_table(
+                TableName=self.table_name,
+                KeySchema=[
+                    {"AttributeName": "repo_id", "KeyType": "HASH"},  # Partition key
+                    {"AttributeName": "file_path", "KeyType": "RANGE"},  # Sort key
+                ],
+                AttributeDefinitions=[
+                    {"AttributeName": "repo_id", "AttributeType": "S"},
+                    {"AttributeName": "file_path", "AttributeType": "S"},
+                ],
+                ProvisionedThroughput={
+                    "ReadCapacityUnits": 10,
+                    "WriteCapacityUnits": 10,
+                },
+            )
+            self.table.wait_until_exists()
+            logger.info(f"Table {self.table_name} created")
+            return self.table
+        except ClientError as err:
+            logger.critical(
+                "Couldn't create table %s. Here's why: %s: %s",
+                self.table_name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+    def _get_table(self):
+        try:
+            table = self.dyn_resource.Table(self.table_name)
+            return table
+        except ClientError as err:
+            logger.critical(
+                "Couldn't get table %s. Here's why: %s: %s",
+                self.table_name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+    def get_hashes(self, repo_id: str) -> dict[str, str]:
+        """
+        Queries the content hash of every indexed file of a repository.
+
+        :return: The hashes by file path.
+        """
+        try:
+            hashes = {}
+            kwargs = {
+                "KeyConditionExpression": Key("repo_id").eq(repo_id),
+                "ProjectionExpression": "file_path, blob_hash",
+            }
+            while True:
+                response = self.table.query(**kwargs)
+                hashes.update(
+                    (item["file_path"], item["blob_hash"])
+                    for item in response["Items"]
+                    if "blob_hash" in item
+                )
+                if not response.get("LastEvaluatedKey"):
+                    break
+                kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        except ClientError as err:
+            logger.critical(
+                "Couldn't query the files of %s. Here's why: %s: %s",
+                repo_id,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+        else:
+            return hashes
+
+    def _part_path(self, file_path: str, part: int) -> str:
+        return f"{file_path}{self.PART_SEPARATOR}{part}"
+
+    def _split_keys(self, call_keys: list[list[str]]) -> list[list[list[str]]]:
+        """Splits the keys in parts of at most MAX_KEYS_SIZE bytes"""
+        parts = [[]]
+        size = 0
+        for key in call_keys:
+            # Both strings plus the list overhead
+            key_size = sum(len(value.encode()) for value in key) + 8
+            if parts[-1] and size + key_size > self.MAX_KEYS_SIZE:
+                parts.append([])
+                size = 0
+            parts[-1].append(key)
+            size += key_size
+        return parts
+
+    def _key(self, repo_id: str, file_path: str) -> dict:
+        return {
+            "repo_id": self.serializer.serialize(repo_id),
+            "file_path": self.serializer.serialize(file_path),
+        }
+
+    def _batch_get(self, repo_id: str, file_paths: list[str], projection: str) -> Iterator[dict]:
+        """
+        Gets the items in batches, the unprocessed keys are requested again
+        with the jittered backoff of the writer.
+        """
+        client = self.pool.client()
+        for i in range(0, len(file_paths), self.BATCH_GET_SIZE):
+            request = {
+                self.table_name: {
+                    "Keys": [
+                        self._key(repo_id, file_path)
+                        for file_path in file_paths[i : i + self.BATCH_GET_SIZE]
+                    ],
+                    "ProjectionExpression": projection,
+                }
+            }
+            for attempt in range(self.writer.max_attempts):
+                response = client.batch_get_item(RequestItems=request)
+                for item in response["Responses"].get(self.table_name, []):
+                    yield {key: self.deserializer.deserialize(value) for key, value in item.items()}
+                request = response.get("UnprocessedKeys")
+                if not request:
+                    break
+                self.writer.backoff(attempt)
+            else:
+                raise UnprocessedItems(
+                    f"{len(request[self.table_name]['Keys'])} keys not read from {self.table_name}"
+                )
+
+    def _get_part_counts(self, repo_id: str, file_paths: list[str]) -> dict[str, int]:
+        """Get the number of extra parts of the stored files"""
+        return {
+            item["file_path"]: int(item.get("part_count", 0))
+            for item in self._batch_get(repo_id, file_paths, "file_path, part_count")
+        }
+
+    def get_call_keys(self, repo_id: str, file_paths: list[str]) -> set[tuple[str, str]]:
+        """
+        Gets the keys of the calls stored for some files of a repository.
+
+        :return: The (path_, id) keys of the calls.
+        """
+        keys = set()
+        try:
+            part_paths = []
+            for item in self._batch_get(repo_id, file_paths, "file_path, call_keys, part_count"):
+                keys.update(tuple(key) for key in item.get("call_keys", []))
+                part_paths.extend(
+                    self._part_path(item["file_path"], part)
+                    for part in range(1, int(item.get("part_count", 0)) + 1)
+                )
+            for item in self._batch_get(repo_id, part_paths, "call_keys"):
+                keys.update(tuple(key) for key in item.get("call_keys", []))
+        except ClientError as err:
+            logger.critical(
+                "Couldn't get the call keys of %s. Here's why: %s: %s",
+                repo_id,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+        else:
+            return keys
+
+    def write_batch(self, files: list[FileDTO]):
+        """
+        Puts the state of files of a repository, replacing the previous one
+        and the parts it had left over.
+        """
+        if not files:
+            return
+        try:
+            old_part_counts = self._get_part_counts(
+                files[0].repo_id, [file.file_path for file in files]
+            )
+            items, stale_keys = [], []
+            for file in files:
+                first, *parts = self._split_keys(file.call_keys)
+                items.append({**vars(file), "call_keys": first, "part_count": len(parts)})
+                for part, call_keys in enumerate(parts, 1):
+                    items.append({
+                        "repo_id": file.repo_id,
+                        "file_path": self._part_path(file.file_path, part),
+                        "call_keys": call_keys,
+                    })
+                for part in range(len(parts) + 1, old_part_counts.get(file.file_path, 0) + 1):
+                    stale_keys.append({
+                        "repo_id": file.repo_id,
+                        "file_path": self._part_path(file.file_path, part),
+                    })
+            self.writer.put(items)
+            if stale_keys:
+                self.writer.delete(stale_keys)
+        except ClientError as err:
+            logger.critical(
+                "Couldn't load data into table %s. Here's why: %s: %s",
+                self.table_name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+    def delete_batch(self, repo_id: str, file_paths: list[str]):
+        """
+        Deletes the state of the files of a repository, with their parts.
+        """
+        try:
+            part_counts = self._get_part_counts(repo_id, file_paths)
+            self.writer.delete(
+                {"repo_id": repo_id, "file_path": path}
+                for file_path in file_paths
+                for path in [file_path] + [
+                    self._part_path(file_path, part)
+                    for part in range(1, part_counts.get(file_path, 0) + 1)
+                ]
+            )
+        except ClientError as err:
+            logger.critical(
+                "Couldn't delete data from table %s. Here's why: %s: %s",
+                self.table_name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
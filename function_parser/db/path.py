@@ -0,0 +1,154 @@
+import logging
+from typing import Iterable
+
+from botocore.exceptions import ClientError
+
+from .bulk_writer import ClientPool
+
+logger = logging.getLogger(__name__)
+
+
+class Path:
+    def __init__(
+        self,
+        dyn_client,
+        table_name: str,
+        pool: ClientPool,
+    ):
+        """
+        Index of the distinct module paths of the calls table with their usage
+        count, so the API doesn't need to scan every call to know them.
+
+        :param dyn_resource: A Boto3 DynamoDB resource.
+        :param pool: Writer threads, shared with the other tables.
+        """
+        self.table_name = table_name
+        self.dyn_resource = dyn_client
+        self.table = self._get_table()
+        self.pool = pool
+
+    def create_table(self):
+        """
+        Creates an Amazon DynamoDB table that stores the distinct module paths.
+        The table uses the module path as the partition key.
+        """
+        try:
+            self.table = self.dyn_resource.create_table(
+                TableName=self.table_name,
+                KeySchema=[
+                    {"AttributeName": "path_", "KeyType": "HASH"},  # Partition key
+                ],
+                AttributeDefinitions=[
+                    {"AttributeName": "path_", "AttributeType": "S"},
+                ],
+                ProvisionedThroughput={
+                    "ReadCapacityUnits": 10,
+                    "WriteCapacityUnits": 10,
+                },
+            )
+            self.table.wait_until_exists()
+            logger.info(f"Table {self.table_name} created")
+            return self.table
+        except ClientError as err:
+            logger.critical(
+                "Couldn't create table %s. Here's why: %s: %s",
+                self.table_name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+    def _get_table(self):
+        try:
+            table = self.dyn_resource.Table(self.table_name)
+            return table
+        except ClientError as err:
+            logger.critical(
+                "Couldn't get table %s. Here's why: %s: %s",
+                self.table_name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+    def add_paths(self, paths: Iterable[str]):
+        """
+        Marks the paths as listed, creating the missing ones. Setting the mark
+        is idempotent and leaves the count alone, so a path with calls is
+        listed even if the update of its count is lost.
+
+        :param paths: Module paths that gained calls.
+        """
+        paths = list(paths)
+        if not paths:
+            return
+        try:
+            for _ in self.pool.map(self._add_path, paths):
+                pass
+        except ClientError as err:
+            logger.critical(
+                "Couldn't list the paths of table %s. Here's why: %s: %s",
+                self.table_name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+    def _add_path(self, path: str):
+        self.pool.client().update_item(
+            TableName=self.table_name,
+            Key={"path_": {"S": path}},
+            UpdateExpression="SET #listed = :true",
+            ExpressionAttributeNames={"#listed": "listed"},
+            ExpressionAttributeValues={":true": {"BOOL": True}},
+        )
+
+    def add_counts(self, counts: dict[str, int]):
+        """
+        Atomically adds the deltas to the usage count of every path, the
+        missing paths are created. One update per distinct path, sent from the
+        writer threads. A path left without calls is no longer listed.
+
+        :param counts: Calls added (or removed if negative) by module path.
+        """
+        counts = [(path, delta) for path, delta in counts.items() if delta]
+        if not counts:
+            return
+        logger.info(f"Updating the count of {len(counts)} paths")
+        try:
+            for _ in self.pool.map(self._add_count, counts):
+                pass
+        except ClientError as err:
+            logger.critical(
+                "Couldn't update the counts of table %s. Here's why: %s: %s",
+                self.table_name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+    def _add_count(self, path_count: tuple[str, int]):
+        path, delta = path_count
+        client = self.pool.client()
+        response = client.update_item(
+            TableName=self.table_name,
+            Key={"path_": {"S": path}},
+            UpdateExpression="ADD call_count :delta",
+            ExpressionAttributeValues={":delta": {"N": str(delta)}},
+            ReturnValues="UPDATED_NEW",
+        )
+        if int(response["Attributes"]["call_count"]["N"]) > 0:
+            return
+        try:
+            # Unless calls were added since
+            client.update_item(
+                TableName=self.table_name,
+                Key={"path_": {"S": path}},
+                UpdateExpression="REMOVE #listed",
+                ConditionExpression="call_count <= :zero",
+                ExpressionAttributeNames={"#listed": "listed"},
+                ExpressionAttributeValues={":zero": {"N": "0"}},
+            )
+        except ClientError as err:
+            if err.response["Error"]["Code"] != "ConditionalCheckFailedException":
+                raise
@@ -0,0 +1,124 @@
+import logging
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+
+class Repository:
+    def __init__(self, dyn_client, table_name: str):
+        """
+        :param dyn_resource: A Boto3 DynamoDB resource.
+        """
+        self.table_name = table_name
+        self.dyn_resource = dyn_client
+        self.table = self._get_table()
+
+    def create_table(self):
+        """
+        Creates an Amazon DynamoDB table that stores the last indexed commit and
+        the count of calls of every repository. The table uses the repository full name as the
+        partition key.
+        """
+        try:
+            self.table = self.dyn_resource.create_table(
+                TableName=self.table_name,
+                KeySchema=[
+                    {"AttributeName": "repo_id", "KeyType": "HASH"},  # Partition key
+                ],
+                AttributeDefinitions=[
+                    {"AttributeName": "repo_id", "AttributeType": "S"},
+                ],
+                ProvisionedThroughput={
+                    "ReadCapacityUnits": 5,
+                    "WriteCapacityUnits": 5,
+                },
+            )
+            self.table.wait_until_exists()
+            logger.info(f"Table {self.table_name} created")
+            return self.table
+        except ClientError as err:
+            logger.critical(
+                "Couldn't create table %s. Here's why: %s: %s",
+                self.table_name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+    def _get_table(self):
+        try:
+            table = self.dyn_resource.Table(self.table_name)
+            return table
+        except ClientError as err:
+            logger.critical(
+                "Couldn't get table %s. Here's why: %s: %s",
+                self.table_name,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+    def get_commit(self, repo_id: str) -> str | None:
+        """
+        Gets the last indexed commit of a repository.
+
+        :param repo_id: The repository full name, owner/name.
+        :return: The commit sha or None if the repository was never indexed.
+        """
+        try:
+            response = self.table.get_item(
+                Key={"repo_id": repo_id}, ProjectionExpression="commit_sha"
+            )
+        except ClientError as err:
+            logger.critical(
+                "Couldn't get the commit of %s. Here's why: %s: %s",
+                repo_id,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+        else:
+            return response.get("Item", {}).get("commit_sha")
+
+    def put_commit(self, repo_id: str, commit_sha: str):
+        """
+        Records the last indexed commit of a repository.
+        """
+        try:
+            self.table.update_item(
+                Key={"repo_id": repo_id},
+                UpdateExpression="SET commit_sha = :commit_sha",
+                ExpressionAttributeValues={":commit_sha": commit_sha},
+            )
+        except ClientError as err:
+            logger.critical(
+                "Couldn't put the commit of %s. Here's why: %s: %s",
+                repo_id,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
+
+    def add_calls(self, repo_id: str, call_delta: int):
+        """
+        Atomically updates the count of calls of a repository.
+
+        :param call_delta: Calls added, or removed if negative.
+        """
+        if not call_delta:
+            return
+        try:
+            self.table.update_item(
+                Key={"repo_id": repo_id},
+                UpdateExpression="ADD call_count :delta",
+                ExpressionAttributeValues={":delta": call_delta},
+            )
+        except ClientError as err:
+            logger.critical(
+                "Couldn't update the call count of %s. Here's why: %s: %s",
+                repo_id,
+                err.response["Error"]["Code"],
+                err.response["Error"]["Message"],
+            )
+            raise
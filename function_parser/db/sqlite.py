@@ -0,0 +1,282 @@
+import json
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager
+from itertools import islice
+from typing import Iterable, Iterator
+
+from models.call import Call as ModelCall
+
+from .call import to_call_dto
+from .file import FileDTO
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = (
+    # Clustered by (path_, id): the primary key is the index of the path queries
+    # and sorts the calls of a path for keyset pagination
+    """
+        CREATE TABLE IF NOT EXISTS calls (
+            path_ TEXT NOT NULL,
+            id TEXT NOT NULL,
+            line_number INTEGER NOT NULL,
+            file_name TEXT NOT NULL,
+            url TEXT NOT NULL,
+            snippet BLOB,
+            PRIMARY KEY (path_, id)
+        ) WITHOUT ROWID
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS repositories (
+            repo_id TEXT PRIMARY KEY,
+            commit_sha TEXT,
+            call_count INTEGER NOT NULL DEFAULT 0
+        )
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS files (
+            repo_id TEXT NOT NULL,
+            file_path TEXT NOT NULL,
+            blob_hash TEXT NOT NULL,
+            call_keys TEXT NOT NULL,
+            PRIMARY KEY (repo_id, file_path)
+        ) WITHOUT ROWID
+    """,
+    """
+        CREATE TABLE IF NOT EXISTS paths (
+            path_ TEXT PRIMARY KEY,
+            call_count INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    """,
+)
+
+
+class SQLite:
+    """
+    Embedded storage backend for single node deployments and tests, with the
+    same tables as the DynamoDB one. Every thread gets its own connection,
+    the database runs in WAL mode so the API can read while the scraper writes.
+    """
+
+    def __init__(self, path: str, init_tables=False) -> None:
+        self.path = path
+        self.local = threading.local()
+        self.call_table = SQLiteCall(self)
+        self.repository_table = SQLiteRepository(self)
+        self.file_table = SQLiteFile(self)
+        self.path_table = SQLitePath(self)
+        if init_tables:
+            logger.info("Starting DB")
+            self.init_tables()
+
+    def connection(self) -> sqlite3.Connection:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # Durable on checkpoints instead of on every commit, safe with WAL
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """
+        Commits the writes of the block at once, or none of them. Writes of the
+        tables inside the block join it instead of committing on their own.
+        """
+        connection = self.connection()
+        if getattr(self.local, "in_transaction", False):
+            yield connection
+            return
+        self.local.in_transaction = True
+        try:
+            with connection:
+                yield connection
+        finally:
+            self.local.in_transaction = False
+
+    def init_tables(self):
+        try:
+            with self.connection() as connection:
+                for schema in SCHEMA:
+                    connection.execute(schema)
+        except sqlite3.Error as err:
+            logger.critical(f"Couldn't create the tables in {self.path}. Here's why: {err}")
+            raise
+
+    def close(self):
+        """Closes the connection of the current thread, the others close with their threads"""
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self.local.connection = None
+
+    def list_tables(self) -> list[str]:
+        rows = self.connection().execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+        return [name for name, in rows]
+
+
+class SQLiteCall:
+    table_name = "calls"
+    WRITE_BATCH_SIZE = 1000
+
+    def __init__(self, database: SQLite):
+        self.database = database
+
+    def write_batch(self, calls: Iterable[ModelCall]) -> int:
+        """
+        Puts the calls in transactions of WRITE_BATCH_SIZE calls, replacing the
+        ones with the same key. The calls are consumed as they come, so a stream
+        is written while it's produced without holding the write lock meanwhile.
+
+        :return: The number of calls written.
+        """
+        written = 0
+        rows = (vars(to_call_dto(call)) for call in calls)
+        try:
+            while batch := list(islice(rows, self.WRITE_BATCH_SIZE)):
+                with self.database.transaction() as connection:
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO calls (path_, id, line_number, file_name, url, snippet)"
+                        " VALUES (:path_, :id, :line_number, :file_name, :url, :snippet)",
+                        batch,
+                    )
+                written += len(batch)
+        except sqlite3.Error as err:
+            logger.critical(f"Couldn't load data into table {self.table_name}. Here's why: {err}")
+            raise
+        return written
+
+    def delete_batch(self, keys: set[tuple[str, str]]):
+        """
+        Deletes calls from the table.
+
+        :param keys: The (path_, id) keys of the calls.
+        """
+        try:
+            with self.database.transaction() as connection:
+                connection.executemany("DELETE FROM calls WHERE path_ = ? AND id = ?", keys)
+        except sqlite3.Error as err:
+            logger.critical(f"Couldn't delete data from table {self.table_name}. Here's why: {err}")
+            raise
+
+
+class SQLiteRepository:
+    table_name = "repositories"
+
+    def __init__(self, database: SQLite):
+        self.database = database
+
+    def get_commit(self, repo_id: str) -> str | None:
+        row = self.database.connection().execute(
+            "SELECT commit_sha FROM repositories WHERE repo_id = ?", (repo_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def put_commit(self, repo_id: str, commit_sha: str):
+        try:
+            with self.database.transaction() as connection:
+                connection.execute(
+                    "INSERT INTO repositories (repo_id, commit_sha) VALUES (?, ?)"
+                    " ON CONFLICT (repo_id) DO UPDATE SET commit_sha = excluded.commit_sha",
+                    (repo_id, commit_sha),
+                )
+        except sqlite3.Error as err:
+            logger.critical(f"Couldn't put the commit of {repo_id}. Here's why: {err}")
+            raise
+
+    def add_calls(self, repo_id: str, call_delta: int):
+        if not call_delta:
+            return
+        try:
+            with self.database.transaction() as connection:
+                connection.execute(
+                    "INSERT INTO repositories (repo_id, call_count) VALUES (?, ?)"
+                    " ON CONFLICT (repo_id) DO UPDATE SET call_count = call_count + excluded.call_count",
+                    (repo_id, call_delta),
+                )
+        except sqlite3.Error as err:
+            logger.critical(f"Couldn't update the call count of {repo_id}. Here's why: {err}")
+            raise
+
+
+class SQLiteFile:
+    table_name = "files"
+
+    def __init__(self, database: SQLite):
+        self.database = database
+
+    def get_hashes(self, repo_id: str) -> dict[str, str]:
+        rows = self.database.connection().execute(
+            "SELECT file_path, blob_hash FROM files WHERE repo_id = ?", (repo_id,)
+        )
+        return dict(rows)
+
+    def get_call_keys(self, repo_id: str, file_paths: list[str]) -> set[tuple[str, str]]:
+        keys = set()
+        connection = self.database.connection()
+        for file_path in file_paths:
+            row = connection.execute(
+                "SELECT call_keys FROM files WHERE repo_id = ? AND file_path = ?",
+                (repo_id, file_path),
+            ).fetchone()
+            if row:
+                keys.update(tuple(key) for key in json.loads(row[0]))
+        return keys
+
+    def write_batch(self, files: list[FileDTO]):
+        try:
+            with self.database.transaction() as connection:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO files (repo_id, file_path, blob_hash, call_keys)"
+                    " VALUES (?, ?, ?, ?)",
+                    (
+                        (file.repo_id, file.file_path, file.blob_hash, json.dumps(file.call_keys))
+                        for file in files
+                    ),
+                )
+        except sqlite3.Error as err:
+            logger.critical(f"Couldn't load data into table {self.table_name}. Here's why: {err}")
+            raise
+
+    def delete_batch(self, repo_id: str, file_paths: list[str]):
+        try:
+            with self.database.transaction() as connection:
+                connection.executemany(
+                    "DELETE FROM files WHERE repo_id = ? AND file_path = ?",
+                    ((repo_id, file_path) for file_path in file_paths),
+                )
+        except sqlite3.Error as err:
+            logger.critical(f"Couldn't delete data from table {self.table_name}. Here's why: {err}")
+            raise
+
+
+class SQLitePath:
+    table_name = "paths"
+
+    def __init__(self, database: SQLite):
+        self.database = database
+
+    def add_paths(self, paths: Iterable[str]):
+        """
+        Paths are listed by their count, which is written in the same
+        transaction as the file state, so it can't be lost.
+        """
+
+    def add_counts(self, counts: dict[str, int]):
+        """
+        Adds the deltas to the usage count of every path in a single
+        transaction, the missing paths are created.
+        """
+        try:
+            with self.database.transaction() as connection:
+                connection.executemany(
+                    "INSERT INTO paths (path_, call_count) VALUES (?, ?)"
+                    " ON CONFLICT (path_) DO UPDATE SET call_count = call_count + excluded.call_count",
+                    ((path, delta) for path, delta in counts.items() if delta),
+                )
+        except sqlite3.Error as err:
+            logger.critical(f"Couldn't update the counts of table {self.table_name}. Here's why: {err}")
+            raise
@@ -0,0 +1,70 @@
+from typing import ContextManager, Iterable, Protocol
+
+from models.call import Call as ModelCall
+
+from .file import FileDTO
+
+
+class CallStore(Protocol):
+    def write_batch(self, calls: Iterable[ModelCall]):
+        ...
+
+    def delete_batch(self, keys: set[tuple[str, str]]):
+        ...
+
+
+class RepositoryStore(Protocol):
+    def get_commit(self, repo_id: str) -> str | None:
+        ...
+
+    def put_commit(self, repo_id: str, commit_sha: str):
+        ...
+
+    def add_calls(self, repo_id: str, call_delta: int):
+        ...
+
+
+class FileStore(Protocol):
+    def get_hashes(self, repo_id: str) -> dict[str, str]:
+        ...
+
+    def get_call_keys(self, repo_id: str, file_paths: list[str]) -> set[tuple[str, str]]:
+        ...
+
+    def write_batch(self, files: list[FileDTO]):
+        ...
+
+    def delete_batch(self, repo_id: str, file_paths: list[str]):
+        ...
+
+
+class PathStore(Protocol):
+    def add_paths(self, paths: Iterable[str]):
+        ...
+
+    def add_counts(self, counts: dict[str, int]):
+        ...
+
+
+class Storage(Protocol):
+    """
+    Tables the ingester writes to, implemented by the DynamoDB and the
+    SQLite backends
+    """
+    call_table: CallStore
+    repository_table: RepositoryStore
+    file_table: FileStore
+    path_table: PathStore
+
+    def init_tables(self):
+        ...
+
+    def transaction(self) -> ContextManager:
+        """Block of writes applied at once where the backend supports it"""
+        ...
+
+    def list_tables(self) -> list[str]:
+        ...
+
+    def close(self):
+        ...
@@ -0,0 +1,3 @@
+class UnprocessedItems(Exception):
+    def __init__(self, message="DynamoDB kept returning unprocessed items"):
+        super().__init__(message)
@@ -0,0 +1,220 @@
+import logging
+import threading
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from itertools import groupby
+from typing import Iterator
+
+from db.file import FileDTO
+from db.storage import Storage
+from local_corpus import LocalCorpus
+from models.call import Call
+from models.repository import Repository
+from pipeline import BackgroundIterator
+from repo_parser import RepoParser
+from repo_scraper import RepoScraper
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ParsedRepository:
+    """
+    Repository being parsed, its calls are streamed while the files are parsed
+    and the file hashes are complete once the calls are consumed
+    """
+    repository: Repository
+    calls: BackgroundIterator
+    parser: RepoParser
+
+    @property
+    def file_hashes(self) -> dict[str, str]:
+        return self.parser.file_hashes
+
+    @property
+    def changed_files(self) -> set[str]:
+        return self.parser.changed_files
+
+    @property
+    def deleted_files(self) -> set[str]:
+        return self.parser.deleted_files
+
+
+class Ingester:
+    """
+    Download, parse and write steps of the pipeline for every repository.
+    Repositories are indexed incrementally: the last indexed commit and the
+    blob hash of every file are recorded, so unchanged repositories are not
+    downloaded and only the added, modified or deleted files are written.
+    """
+
+    # Calls and files written before the state of their files is stored
+    FLUSH_CALLS = 1000
+    FLUSH_FILES = 100
+
+    def __init__(
+        self,
+        scraper: RepoScraper | LocalCorpus,
+        database: Storage,
+        executor: ProcessPoolExecutor | None = None,
+        repo_count: int = 0,
+        context_lines: int | None = 2,
+        call_buffer_size: int = 10000,
+    ) -> None:
+        """
+        :param call_buffer_size: Calls parsed ahead of the writer for every repository.
+        """
+        self.scraper = scraper
+        self.database = database
+        self.executor = executor
+        self.repo_count = repo_count
+        self.context_lines = context_lines
+        self.call_buffer_size = call_buffer_size
+        self.written = 0
+        self.lock = threading.Lock()
+
+    def close(self) -> None:
+        """Releases the database writers once every repository is written"""
+        self.database.close()
+
+    def is_indexed(self, repo_id: str, commit_sha: str) -> bool:
+        return self.database.repository_table.get_commit(repo_id) == commit_sha
+
+    @staticmethod
+    def metrics_name(repo_url: str) -> str:
+        return repo_url.split("/repos/")[-1]
+
+    def download(self, repo_url: str) -> Repository | None:
+        with metrics.repository(self.metrics_name(repo_url)):
+            repo = self.scraper.get_repository(repo_url, self.is_indexed)
+        if repo is None:
+            metrics.log_repository(self.metrics_name(repo_url))
+        return repo
+
+    def parse(self, repo: Repository) -> ParsedRepository:
+        """Starts parsing the repository in the background, the writer consumes its calls"""
+        with metrics.repository(self.metrics_name(repo.api_url)):
+            try:
+                known_hashes = self.database.file_table.get_hashes(repo.full_name)
+            except Exception:
+                repo.close()
+                raise
+            repo_parser = RepoParser(
+                repo, self.executor, known_hashes, self.context_lines, release_sources=True
+            )
+            calls = BackgroundIterator(self._parse_calls(repo, repo_parser), self.call_buffer_size)
+            return ParsedRepository(repo, calls, repo_parser)
+
+    @staticmethod
+    def _parse_calls(repo: Repository, repo_parser: RepoParser) -> Iterator[Call]:
+        try:
+            # Without the time waiting for the writer to catch up
+            yield from metrics.timed("parse", repo_parser.iter_repo_calls())
+            metrics.count("files_parsed", len(repo_parser.changed_files))
+        finally:
+            repo.close()
+
+    def write(self, parsed: ParsedRepository) -> None:
+        name = self.metrics_name(parsed.repository.api_url)
+        try:
+            with metrics.repository(name):
+                self._write(parsed)
+        finally:
+            parsed.calls.close()
+        metrics.log_repository(name)
+
+    def _write(self, parsed: ParsedRepository) -> None:
+        """
+        Writes the calls while the repository is still being parsed. They come
+        grouped by file, and only the files parsed since the last flush are
+        kept, so the memory doesn't grow with the size of the repository.
+        """
+        repo_id = parsed.repository.full_name
+        pending: list[tuple[str, list[Call]]] = []
+        pending_calls = 0
+        flushed_files = set()
+        for file_path, calls in groupby(parsed.calls, key=lambda call: call.file.path):
+            pending.append((file_path, list(calls)))
+            pending_calls += len(pending[-1][1])
+            if pending_calls >= self.FLUSH_CALLS or len(pending) >= self.FLUSH_FILES:
+                self._flush(parsed, pending)
+                flushed_files.update(path for path, _ in pending)
+                pending, pending_calls = [], 0
+        if pending:
+            self._flush(parsed, pending)
+            flushed_files.update(path for path, _ in pending)
+        # Changed files without calls don't show up in the stream
+        empty_files = sorted(parsed.changed_files - flushed_files)
+        for i in range(0, len(empty_files), self.FLUSH_FILES):
+            self._flush(parsed, [(path, []) for path in empty_files[i : i + self.FLUSH_FILES]])
+        deleted_files = sorted(parsed.deleted_files)
+        for i in range(0, len(deleted_files), self.FLUSH_FILES):
+            self._flush(parsed, [], deleted_files[i : i + self.FLUSH_FILES])
+        logger.info(
+            f"{repo_id}: {len(parsed.changed_files)} changed and "
+            f"{len(parsed.deleted_files)} deleted files"
+        )
+        # Last, so a failed write is retried on the next run
+        with metrics.timer("write"):
+            self.database.repository_table.put_commit(repo_id, parsed.repository.commit_sha)
+
+        with self.lock:
+            self.written += 1
+            logger.info(f"{'#'*9} {self.written} / {self.repo_count} repositories {'#'*9}")
+
+    def _flush(
+        self,
+        parsed: ParsedRepository,
+        files: list[tuple[str, list[Call]]],
+        deleted_files: list[str] | None = None,
+    ) -> None:
+        """
+        Writes the calls of some files, then replaces their stored state and
+        updates the usage counts by the calls added or removed.
+
+        :param files: The path and the calls of every changed file.
+        :param deleted_files: Paths of the files that no longer exist.
+        """
+        repo_id = parsed.repository.full_name
+        deleted_files = deleted_files or []
+        calls = [call for _, file_calls in files for call in file_calls]
+        file_call_keys = {
+            path: [[call.path, call.hex_id] for call in file_calls] for path, file_calls in files
+        }
+        new_keys = {(path, id_) for keys in file_call_keys.values() for path, id_ in keys}
+        # Only the table calls, not the time waiting for the parser
+        with metrics.timer("write"):
+            if calls:
+                self.database.call_table.write_batch(calls)
+            old_keys = self.database.file_table.get_call_keys(
+                repo_id, list(file_call_keys) + deleted_files
+            )
+            stale_keys = old_keys - new_keys
+            if stale_keys:
+                self.database.call_table.delete_batch(stale_keys)
+            # Usage counts only change by the calls added or removed
+            count_deltas = Counter(path for path, _ in new_keys - old_keys)
+            count_deltas.subtract(path for path, _ in stale_keys)
+            # Listed before the file state is stored, so a path whose count is
+            # lost below still shows up
+            self.database.path_table.add_paths(
+                path for path, delta in count_deltas.items() if delta > 0
+            )
+            # The deltas are applied after the file state, in the same transaction
+            # where the backend has them. A failed write recomputes them on the
+            # next run, once stored they are never computed again.
+            with self.database.transaction():
+                if file_call_keys:
+                    self.database.file_table.write_batch([
+                        FileDTO(repo_id, path, parsed.file_hashes[path], keys)
+                        for path, keys in file_call_keys.items()
+                    ])
+                if deleted_files:
+                    self.database.file_table.delete_batch(repo_id, deleted_files)
+                self.database.repository_table.add_calls(repo_id, sum(count_deltas.values()))
+                self.database.path_table.add_counts(count_deltas)
+        metrics.count("calls", len(calls))
+        if stale_keys:
+            metrics.count("calls_deleted", len(stale_keys))
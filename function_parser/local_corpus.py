@@ -0,0 +1,226 @@
+import logging
+import os
+import tarfile
+import zipfile
+from fnmatch import fnmatch
+from functools import partial
+from hashlib import sha1
+from pathlib import Path
+from typing import Callable, Iterator
+
+from models.file import File
+from models.folder import Folder
+from models.repository import Repository
+from utils.archive import Archive, TarArchive
+from utils.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+ZIP_SUFFIXES = (".zip", ".whl")
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+
+def archive_suffix(path: str) -> str | None:
+    return next((suffix for suffix in (*ZIP_SUFFIXES, *TAR_SUFFIXES) if path.endswith(suffix)), None)
+
+
+def read_file(path: str) -> bytes:
+    with open(path, "rb") as file:
+        return file.read()
+
+
+class LocalCorpus:
+    """
+    Source of repositories already on disk, like site-packages trees, mirrors
+    or tarballs, a drop in replacement of the RepoScraper for the ingester.
+    Every directory or archive inside a corpus root is a repository, owned by
+    the root, and every root that is an archive is a repository too.
+    """
+
+    MAX_FILE_SIZE = 1024 * 1024
+    SPOOL_SIZE = 16 * 1024 * 1024
+    IGNORED_FOLDERS = {"__pycache__", "node_modules"}
+
+    def __init__(
+        self,
+        roots: tuple[str, ...],
+        max_file_size: int = MAX_FILE_SIZE,
+        skip_globs: tuple[str, ...] = (),
+        spool_size: int = SPOOL_SIZE,
+    ) -> None:
+        """
+        :param roots: Directories with a repository in every subdirectory or
+                      archive, or archives with a single repository.
+        :param max_file_size: Python files bigger than this are skipped, 0 means no limit.
+        :param skip_globs: Patterns of the repository relative paths to skip.
+        :param spool_size: Python files of a compressed tarball bigger than this
+                           in total are copied to disk until parsed.
+        """
+        self.roots = roots
+        self.max_file_size = max_file_size
+        self.skip_globs = skip_globs
+        self.spool_size = spool_size
+
+    def get_repository_paths(self) -> Iterator[str]:
+        """Get the absolute path of every repository of the corpus"""
+        for root in self.roots:
+            root = os.path.abspath(root)
+            if os.path.isfile(root) and archive_suffix(root):
+                yield root
+                continue
+            if not os.path.isdir(root):
+                logger.warning(f"Skipping {root}, not a directory or archive")
+                continue
+            for entry in sorted(os.scandir(root), key=lambda entry: entry.name):
+                if entry.name.startswith(".") or entry.name in self.IGNORED_FOLDERS:
+                    continue
+                if entry.is_dir() or (entry.is_file() and archive_suffix(entry.name)):
+                    yield entry.path
+
+    def get_repository(
+        self, path: str, is_indexed: Callable[[str, str], bool] | None = None
+    ) -> Repository | None:
+        """
+        Builds the repository of a directory or archive. Instead of a commit,
+        its fingerprint is the size and modification time of the files, so
+        unchanged repositories are skipped without reading them.
+
+        :param is_indexed: Tells if a repository full name is already indexed at a
+                           fingerprint, those repositories are not read again.
+        """
+        owner = os.path.basename(os.path.dirname(path))
+        suffix = archive_suffix(path) if os.path.isfile(path) else None
+        name = os.path.basename(path)[: -len(suffix)] if suffix else os.path.basename(path)
+        archive = None
+        try:
+            with metrics.timer("local_index"):
+                if suffix in ZIP_SUFFIXES:
+                    archive = self._open_zip(path)
+                    folder, fingerprint = self._get_folder_from_zip(archive, name, path)
+                elif suffix:
+                    archive = TarArchive(path, suffix != ".tar", self.spool_size)
+                    folder, fingerprint = self._get_folder_from_tar(archive, name, path)
+                else:
+                    folder, fingerprint = self._get_folder_from_directory(name, path)
+        except (OSError, tarfile.TarError, zipfile.BadZipFile, ValueError) as ex:
+            logger.warning(f"Couldn't read {path}: {ex}")
+            if archive is not None:
+                archive.close()
+            return None
+        repo = Repository(
+            0, name, owner, Path(path).as_uri(), path, "Python", "", folder, fingerprint, archive
+        )
+        if is_indexed is not None and is_indexed(repo.full_name, fingerprint):
+            logger.info(f"{repo.full_name} is up to date")
+            repo.close()
+            return None
+        return repo
+
+    @staticmethod
+    def _open_zip(path: str) -> Archive:
+        file = open(path, "rb")
+        try:
+            return Archive(file)
+        except zipfile.BadZipFile:
+            file.close()
+            raise
+
+    def _skip(self, relative_path: str, size: int) -> bool:
+        if self.max_file_size and size > self.max_file_size:
+            logger.debug(f"Skipping {relative_path}, {size} bytes")
+            return True
+        return any(fnmatch(relative_path, glob) for glob in self.skip_globs)
+
+    def _get_folder_from_directory(self, name: str, path: str) -> tuple[Folder, str]:
+        """Walks the directory, the files are only read when parsed"""
+        root = Folder(name, [])
+        folders = {path: root}
+        fingerprint = sha1()
+        for directory, dir_names, file_names in os.walk(path):
+            folder = folders[directory]
+            # Pruned in place so os.walk doesn't descend into them
+            dir_names[:] = sorted(
+                dir_name for dir_name in dir_names
+                if not dir_name.startswith(".") and dir_name not in self.IGNORED_FOLDERS
+            )
+            for dir_name in dir_names:
+                folders[os.path.join(directory, dir_name)] = child = Folder(dir_name, [])
+                folder.files.append(child)
+            for file_name in sorted(file_names):
+                if not file_name.endswith(".py"):
+                    continue
+                file_path = os.path.join(directory, file_name)
+                relative_path = os.path.relpath(file_path, path).replace(os.sep, "/")
+                stat = os.stat(file_path)
+                if self._skip(relative_path, stat.st_size):
+                    continue
+                fingerprint.update(f"{relative_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+                folder.files.append(File(
+                    file_name,
+                    Path(file_path).as_uri(),
+                    path=relative_path,
+                    loader=partial(read_file, file_path),
+                ))
+        return root, fingerprint.hexdigest()
+
+    @staticmethod
+    def _archive_fingerprint(path: str) -> str:
+        stat = os.stat(path)
+        return sha1(f"{stat.st_size}\0{stat.st_mtime_ns}".encode()).hexdigest()
+
+    @staticmethod
+    def _add_file(
+        root: Folder, folders: dict[tuple[str, ...], Folder], path: tuple[str, ...], file: File
+    ) -> None:
+        for i in range(1, len(path)):
+            folder = folders.get(path[:i])
+            if folder is None:
+                folder = folders[path[:i]] = Folder(path[i - 1], [])
+                folders.get(path[: i - 1], root).files.append(folder)
+        folders.get(path[:-1], root).files.append(file)
+
+    def _get_folder_from_zip(self, archive: Archive, name: str, path: str) -> tuple[Folder, str]:
+        """Indexes the python files of a zip, they are read from it when parsed"""
+        root = Folder(name, [])
+        folders: dict[tuple[str, ...], Folder] = {}
+        for member in archive.members():
+            member_path = tuple(item for item in member.filename.split("/") if item)
+            if member.is_dir() or not member_path or not member_path[-1].endswith(".py"):
+                continue
+            relative_path = "/".join(member_path)
+            if self._skip(relative_path, member.file_size):
+                continue
+            file = File(
+                member_path[-1],
+                f"{Path(path).as_uri()}#{relative_path}",
+                path=relative_path,
+                loader=partial(archive.read, member.filename),
+            )
+            self._add_file(root, folders, member_path, file)
+        return root, self._archive_fingerprint(path)
+
+    def _get_folder_from_tar(
+        self, archive: TarArchive, name: str, path: str
+    ) -> tuple[Folder, str]:
+        """
+        Indexes the python files of a tarball in a single pass, they are read
+        from the archive when parsed
+        """
+        root = Folder(name, [])
+        folders: dict[tuple[str, ...], Folder] = {}
+        for member in archive.members():
+            member_path = tuple(item for item in member.name.split("/") if item not in ("", "."))
+            if not member.isfile() or not member_path or not member_path[-1].endswith(".py"):
+                continue
+            relative_path = "/".join(member_path)
+            if self._skip(relative_path, member.size):
+                continue
+            archive.add(member)
+            file = File(
+                member_path[-1],
+                f"{Path(path).as_uri()}#{relative_path}",
+                path=relative_path,
+                loader=partial(archive.read, member.name),
+            )
+            self._add_file(root, folders, member_path, file)
+        return root, self._archive_fingerprint(path)
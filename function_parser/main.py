@@ -1,12 +1,18 @@
 import logging
 import os
+from concurrent.futures import ProcessPoolExecutor
 
 from dotenv import load_dotenv
 
 from config import set_logger
 from db.dynamo import Dynamo
-from repo_parser import RepoParser
+from db.sqlite import SQLite
+from ingester import Ingester
+from local_corpus import LocalCorpus
+from pipeline import Pipeline
 from repo_scraper import RepoScraper
+from utils.cache import ArchiveStore, ResponseCache
+from utils.metrics import metrics
 
 # LOGGING
 set_logger()
@@ -14,25 +20,90 @@ logger = logging.getLogger(__name__)
 
 # ENVS
 load_dotenv()
-github_token = os.getenv("GITHUBTOKEN")
+github_tokens = tuple(
+    token for token in (os.getenv("GITHUBTOKENS") or os.getenv("GITHUBTOKEN", "")).split(",") if token
+)
+github_api_url = os.getenv("GITHUBAPIURL", "https://api.github.com")
+github_url = os.getenv("GITHUBURL", "https://github.com")
+request_concurrency = int(os.getenv("REQUESTCONCURRENCY", 5))
 repo_count = int(os.getenv("REPOCOUNT", 0))
 aws_region = os.getenv("AWSREGION")
 aws_access_key_id = os.getenv("AWSACCESSKEY")
 aws_secret_access_key = os.getenv("AWSSECRETACCESSKEY")
 aws_endpoint = os.getenv("AWSENDPOINT")
+storage = os.getenv("STORAGE", "dynamo")
+sqlite_path = os.getenv("SQLITEPATH", "calls.db")
+parser_workers = int(os.getenv("PARSERWORKERS", 1))
+download_workers = int(os.getenv("DOWNLOADWORKERS", 2))
+parse_workers = int(os.getenv("PARSESTAGEWORKERS", 1))
+write_workers = int(os.getenv("WRITERWORKERS", 1))
+write_concurrency = int(os.getenv("WRITECONCURRENCY", 16))
+queue_size = int(os.getenv("PIPELINEQUEUESIZE", 2))
+call_buffer_size = int(os.getenv("CALLBUFFERSIZE", 10000))
+max_file_size = int(os.getenv("MAXFILESIZE", RepoScraper.MAX_FILE_SIZE))
+skip_globs = tuple(glob for glob in os.getenv("SKIPGLOBS", "").split(",") if glob)
+snippet_lines = int(os.getenv("SNIPPETLINES", 2))
+cache_dir = os.getenv("CACHEDIR")
+archive_cache_size = int(os.getenv("ARCHIVECACHESIZE", 2 * 1024**3))
+local_corpus = tuple(path for path in os.getenv("LOCALCORPUS", "").split(",") if path)
 
 
 if __name__ == "__main__":
-    if not all((github_token, aws_region, aws_access_key_id, aws_secret_access_key)):
+    if not (github_tokens or local_corpus):
         raise ValueError("Missing environmentals!")
 
-    database = Dynamo(
-        aws_region, aws_access_key_id, aws_secret_access_key, aws_endpoint, True
+    if storage == "sqlite":
+        database = SQLite(sqlite_path, True)
+    elif all((aws_region, aws_access_key_id, aws_secret_access_key)):
+        database = Dynamo(
+            aws_region,
+            aws_access_key_id,
+            aws_secret_access_key,
+            aws_endpoint,
+            True,
+            write_concurrency,
+        )
+    else:
+        raise ValueError("Missing environmentals!")
+    if local_corpus:
+        # Reads the repositories from disk instead of GitHub
+        scraper = LocalCorpus(local_corpus, max_file_size, skip_globs)
+        repo_urls = list(scraper.get_repository_paths())
+        repo_count = len(repo_urls)
+    else:
+        response_cache = archive_store = None
+        if cache_dir:
+            response_cache = ResponseCache(os.path.join(cache_dir, "responses"))
+            archive_store = ArchiveStore(os.path.join(cache_dir, "archives"), archive_cache_size)
+        scraper = RepoScraper(
+            github_tokens,
+            max_file_size,
+            skip_globs,
+            response_cache=response_cache,
+            archive_store=archive_store,
+            request_concurrency=request_concurrency,
+            api_url=github_api_url,
+            web_url=github_url,
+        )
+        repo_urls = scraper.get_top_repo_urls(repo_count)
+    executor = ProcessPoolExecutor(parser_workers) if parser_workers > 1 else None
+    ingest = Ingester(
+        scraper,
+        database,
+        executor,
+        repo_count,
+        snippet_lines if snippet_lines >= 0 else None,
+        call_buffer_size,
+    )
+
+    pipeline = (
+        Pipeline(queue_size)
+        .add_stage("download", ingest.download, download_workers)
+        .add_stage("parse", ingest.parse, parse_workers)
+        .add_stage("write", ingest.write, write_workers)
     )
-    scraper = RepoScraper(github_token)
-    
-    for i, repo in enumerate(scraper.get_top_repos(repo_count), 1):
-        repo_parser = RepoParser(repo)
-        repo_calls = repo_parser.get_repo_calls()
-        database.call_table.write_batch_threaded(repo_calls)
-        logging.info(f"{'#'*9} {i} / {repo_count} repositories {'#'*9}")
+    pipeline.run(repo_urls)
+    ingest.close()
+    if executor:
+        executor.shutdown()
+    metrics.log_summary()
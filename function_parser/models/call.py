@@ -1,26 +1,43 @@
-import time
+import sys
 from dataclasses import dataclass
 from hashlib import md5
 
 from .file import File
 
 
-@dataclass
+@dataclass(slots=True)
 class Call:
-    id: str
+    # md5 digest, hex_id is the key stored in the database
+    id: bytes
     path: str
     line_number: int
     file: File
+    # zlib compressed source lines around the call
+    snippet: bytes | None
 
-    def __init__(self, path: str, line_number: int, file: File) -> None:
-        unique_id = f"{path}{file.web_url}{line_number}{time.time()}"
-        self.id = md5(unique_id.encode("utf-8")).hexdigest()
-        self.path = path
+    def __init__(
+        self,
+        path: str,
+        line_number: int,
+        file: File,
+        repository: str = "",
+        snippet: bytes | None = None,
+    ) -> None:
+        # Only depends on the content so writing it again overwrites the same item
+        unique_id = "\0".join((path, repository, file.path or file.web_url, str(line_number)))
+        self.id = md5(unique_id.encode("utf-8")).digest()
+        # The same few paths repeat across millions of calls
+        self.path = sys.intern(path)
         self.line_number = line_number
         self.file = file
+        self.snippet = snippet
+
+    @property
+    def hex_id(self) -> str:
+        return self.id.hex()
 
     def __eq__(self, __o: object) -> bool:
         return self.id == __o.id
 
     def __hash__(self) -> int:
-        return hash(self.id)
\ No newline at end of file
+        return hash(self.id)
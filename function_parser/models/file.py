@@ -1,8 +1,27 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from typing import Callable
 
 
-@dataclass
+@dataclass(slots=True)
 class File:
     name: str
     web_url: str
-    data: None | str
+    data: None | bytes = None
+    # Relative to the repository root
+    path: str = ""
+    # Loads the source on demand, e.g. from the repository archive
+    loader: Callable[[], bytes] | None = field(default=None, repr=False, compare=False)
+
+    @property
+    def has_source(self) -> bool:
+        return self.data is not None or self.loader is not None
+
+    def read(self) -> bytes | None:
+        """Get the file source without keeping it in memory"""
+        if self.data is None and self.loader is not None:
+            return self.loader()
+        return self.data
+
+    def release(self) -> None:
+        """Drops the source kept in memory, files with a loader can still be read"""
+        self.data = None
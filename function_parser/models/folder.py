@@ -5,7 +5,7 @@ from typing import TypeVar
 FolderType = TypeVar("FolderType", bound="Folder")
 
 
-@dataclass
+@dataclass(slots=True)
 class Folder:
     name: str
     files: list[FolderType | File]
@@ -1,5 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from models.folder import Folder
+from utils.archive import Archive, TarArchive
 
 
 @dataclass()
@@ -12,3 +13,15 @@ class Repository:
     language: str
     default_branch: str
     directory: Folder
+    commit_sha: str = ""
+    archive: Archive | TarArchive | None = field(default=None, repr=False, compare=False)
+
+    @property
+    def full_name(self) -> str:
+        return f"{self.owner}/{self.name}"
+
+    def close(self) -> None:
+        """Releases the archive the files are read from"""
+        if self.archive is not None:
+            self.archive.close()
+            self.archive = None
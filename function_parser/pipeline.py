@@ -0,0 +1,151 @@
+import contextvars
+import logging
+import threading
+from dataclasses import dataclass, field
+from queue import Full, Queue
+from typing import Any, Callable, Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of the items on a queue
+DONE = object()
+
+
+@dataclass
+class Stage:
+    name: str
+    function: Callable[[Any], Any]
+    workers: int = 1
+    threads: list[threading.Thread] = field(default_factory=list)
+    running: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class Pipeline:
+    """
+    Runs items through a chain of stages, each one with its own worker threads.
+    Stages are connected by bounded queues so a slow stage blocks the previous
+    ones instead of piling up results in memory. A stage returning None drops
+    the item, an exception is logged and only drops that item.
+    """
+
+    def __init__(self, queue_size: int = 2) -> None:
+        self.queue_size = queue_size
+        self.stages: list[Stage] = []
+
+    def add_stage(self, name: str, function: Callable[[Any], Any], workers: int = 1):
+        self.stages.append(Stage(name, function, max(workers, 1)))
+        return self
+
+    def run(self, items: Iterable) -> None:
+        queues = [Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        for i, stage in enumerate(self.stages):
+            stage.running = stage.workers
+            stage.threads = [
+                threading.Thread(
+                    target=self._work,
+                    args=(stage, queues[i], queues[i + 1]),
+                    name=f"{stage.name}-{n}",
+                    daemon=True,
+                )
+                for n in range(stage.workers)
+            ]
+            for thread in stage.threads:
+                thread.start()
+        # Drains the last queue so the final stage never blocks
+        drain = threading.Thread(target=self._drain, args=(queues[-1],), daemon=True)
+        drain.start()
+        try:
+            for item in items:
+                queues[0].put(item)
+        finally:
+            queues[0].put(DONE)
+            for stage in self.stages:
+                for thread in stage.threads:
+                    thread.join()
+            drain.join()
+
+    def _work(self, stage: Stage, in_queue: Queue, out_queue: Queue) -> None:
+        while True:
+            item = in_queue.get()
+            if item is DONE:
+                # Lets the sibling workers see it too
+                in_queue.put(DONE)
+                break
+            try:
+                result = stage.function(item)
+            except Exception:
+                logger.exception(f"Stage {stage.name} failed")
+                continue
+            if result is not None:
+                out_queue.put(result)
+        with stage.lock:
+            stage.running -= 1
+            if not stage.running:
+                out_queue.put(DONE)
+
+    @staticmethod
+    def _drain(queue: Queue) -> None:
+        while queue.get() is not DONE:
+            pass
+
+
+@dataclass
+class Failure:
+    exception: BaseException
+
+
+class BackgroundIterator:
+    """
+    Consumes an iterable in its own thread, buffering at most max_size items,
+    so a producer runs ahead of its consumer without unbounded memory. Errors
+    of the producer are raised to the consumer, and a consumer that stops
+    early stops the producer, closing it if it's a generator.
+    """
+
+    def __init__(self, iterable: Iterable, max_size: int = 1000) -> None:
+        self.queue = Queue(max(max_size, 1))
+        self.stopped = threading.Event()
+        # Keeps the context variables of the caller, like the metrics repository
+        context = contextvars.copy_context()
+        self.thread = threading.Thread(
+            target=context.run, args=(self._produce, iter(iterable)), daemon=True
+        )
+        self.thread.start()
+
+    def _produce(self, iterator: Iterator) -> None:
+        try:
+            for item in iterator:
+                if not self._put(item):
+                    return
+        except Exception as ex:
+            self._put(Failure(ex))
+            return
+        finally:
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+        self._put(DONE)
+
+    def _put(self, item: Any) -> bool:
+        """Waits for room in the queue, gives up once the consumer stopped"""
+        while not self.stopped.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def __iter__(self) -> Iterator:
+        try:
+            while (item := self.queue.get()) is not DONE:
+                if isinstance(item, Failure):
+                    raise item.exception
+                yield item
+        finally:
+            self.close()
+
+    def close(self) -> None:
+        """Stops the producer, the items left are dropped"""
+        self.stopped.set()
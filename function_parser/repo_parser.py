@@ -1,8 +1,27 @@
 import logging
 import ast
 import builtins
+import os
+import zlib
+from concurrent.futures import FIRST_COMPLETED, Executor, Future, wait
+from dataclasses import dataclass, field
+from hashlib import sha1
+from itertools import groupby, islice
+from typing import Iterator
 
-from ast import Attribute, ClassDef, IfExp, Import, ImportFrom, Name, Subscript, expr
+from ast import (
+    AsyncFunctionDef,
+    Attribute,
+    ClassDef,
+    FunctionDef,
+    IfExp,
+    Import,
+    ImportFrom,
+    Lambda,
+    Name,
+    Subscript,
+    expr,
+)
 from ast import Call as AstCall
 
 from models.call import Call
@@ -12,68 +31,256 @@ from models.repository import Repository
 
 logger = logging.getLogger(__name__)
 
+BUILTINS = {name for name, call in vars(builtins).items() if getattr(call, '__call__', None)}
+# Files sent to a worker process per task, and tasks kept in flight per core
+CHUNK_SIZE = 32
+PENDING_CHUNKS = 2 * (os.cpu_count() or 1)
+MAX_SNIPPET_LINES = 20
+MAX_LINE_LENGTH = 200
+
+
+@dataclass
+class Scope:
+    """Names bound by absolute imports inside a module, class or function"""
+    parent: "Scope | None" = None
+    symbols: dict[str, list[str]] = field(default_factory=dict)
+    # Path of the first base class, only set on class scopes that inherit
+    base_path: list[str] | None = None
+    is_class: bool = False
+
+    def lookup(self, name: str) -> list[str] | None:
+        scope = self
+        while scope is not None:
+            module_path = scope.symbols.get(name)
+            if module_path is not None:
+                return module_path
+            scope = scope.parent
+        return None
+
+
+class CallResolver:
+    """
+    Walks a module once, binding every import alias to its module path in the
+    scope where it appears. Calls are resolved after the walk so imports placed
+    below their use (inside functions, at the bottom of the module) still apply.
+    The walk keeps its own stack of (node, scope) instead of recursing, deeply
+    nested expressions that parse fine don't exhaust the recursion limit.
+    """
+
+    FUNCTION_TYPES = (FunctionDef, AsyncFunctionDef, Lambda)
+
+    def __init__(self, builtin_names: set[str]) -> None:
+        self.builtin_names = builtin_names
+        self.pending: list[tuple[list[str], int, int, Scope]] = []
+
+    def resolve(self, module: ast.Module) -> list[tuple[str, int, int]]:
+        """Get the (full path, line number, end line number) of every resolvable call"""
+        self._walk(module)
+        calls = []
+        for call_path, line_number, end_line_number, scope in self.pending:
+            full_path = self._resolve_path(call_path, scope)
+            if full_path:
+                calls.append((".".join(full_path), line_number, end_line_number))
+        return calls
+
+    def _walk(self, module: ast.Module) -> None:
+        """Visits the nodes in source order, like a recursive visitor would"""
+        stack: list[tuple[ast.AST, Scope]] = [(module, Scope())]
+        while stack:
+            node, scope = stack.pop()
+            type_ = type(node)
+            if type_ is Import:
+                self._bind_import(node, scope)
+                continue
+            if type_ is ImportFrom:
+                self._bind_import_from(node, scope)
+                continue
+            if type_ is ClassDef:
+                base_path = get_call_path(node.bases[0]) if node.bases else None
+                class_scope = Scope(parent=scope, base_path=base_path, is_class=True)
+                children = [
+                    (item, scope) for item in (*node.decorator_list, *node.bases, *node.keywords)
+                ]
+                children += [(item, class_scope) for item in node.body]
+            elif type_ in self.FUNCTION_TYPES:
+                function_scope = Scope(parent=scope)
+                children = [(child, function_scope) for child in ast.iter_child_nodes(node)]
+            else:
+                if type_ is AstCall:
+                    call_path = get_call_path(node)
+                    if call_path:
+                        self.pending.append((call_path, node.lineno, node.end_lineno, scope))
+                children = [(child, scope) for child in ast.iter_child_nodes(node)]
+            stack.extend(reversed(children))
+
+    def _resolve_path(self, call_path: list[str], scope: Scope) -> list[str] | None:
+        """Get the full function path from the module"""
+        if call_path[0] == "super":
+            # We search for the inherited class
+            class_scope = scope
+            while class_scope is not None and not class_scope.is_class:
+                class_scope = class_scope.parent
+            if class_scope is None:
+                return None
+            if not class_scope.base_path:
+                return []
+            # TODO MULTIPLE INHERITANCES
+            call_path = class_scope.base_path + call_path
+        module_path = scope.lookup(call_path[0])
+        if module_path is not None:
+            return module_path + call_path[1:]
+        if call_path[0] in self.builtin_names:
+            return call_path
+        return None
+
+    @staticmethod
+    def _bind_import(node: Import, scope: Scope) -> None:
+        for alias in node.names:
+            if alias.asname:
+                scope.symbols[alias.asname] = alias.name.split(".")
+            else:
+                # `import a.b` only binds `a`
+                name = alias.name.split(".")[0]
+                scope.symbols[name] = [name]
+
+    @staticmethod
+    def _bind_import_from(node: ImportFrom, scope: Scope) -> None:
+        if node.level or not node.module:
+            # Relative imports are always local
+            return
+        module_path = node.module.split(".")
+        for alias in node.names:
+            if alias.name == "*":
+                continue
+            scope.symbols[alias.asname or alias.name] = module_path + [alias.name]
+
+
+def get_call_path(item: expr) -> list[str]:
+    """Get a list of names from method call"""
+    path = []
+    # TODO searching args too?
+    while True:
+        type_ = type(item)
+        if type_ is Name:
+            path.append(item.id)
+            break
+        elif type_ is Attribute:
+            path.append(item.attr)
+            item = item.value
+        elif type_ is AstCall:
+            item = item.func
+        elif type_ is Subscript:
+            item = item.value
+        elif type_ is IfExp:
+            # TODO skipping ifs atm
+            break
+        else:
+            break
+    return path[::-1]
+
+
+def get_snippet(
+    lines: list[bytes], line_number: int, end_line_number: int, context_lines: int
+) -> bytes:
+    """
+    Compressed source of the call lines plus context_lines around them, at most
+    MAX_SNIPPET_LINES lines of MAX_LINE_LENGTH characters
+    """
+    start = max(line_number - 1 - context_lines, 0)
+    end = min(end_line_number + context_lines, len(lines), start + MAX_SNIPPET_LINES)
+    snippet = b"\n".join(line[:MAX_LINE_LENGTH] for line in lines[start:end])
+    return zlib.compress(snippet.decode("utf-8", "replace").encode("utf-8"))
+
+
+def parse_source(
+    data: bytes | str, context_lines: int | None = None
+) -> list[tuple[str, int, bytes | None]]:
+    """
+    Get the (full path, line number, snippet) of every call in a python source.
+
+    :param context_lines: Lines around the call kept in its snippet, no snippets when None.
+    """
+    try:
+        module = ast.parse(data)
+    except (SyntaxError, ValueError, RecursionError):
+        # The parser itself recurses on deeply nested sources
+        return []
+    calls = CallResolver(BUILTINS).resolve(module)
+    if context_lines is None:
+        return [(full_path, line_number, None) for full_path, line_number, _ in calls]
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    lines = data.splitlines()
+    snippets = {}
+    result = []
+    for full_path, line_number, end_line_number in calls:
+        span = (line_number, end_line_number)
+        if span not in snippets:
+            snippets[span] = get_snippet(lines, line_number, end_line_number, context_lines)
+        result.append((full_path, line_number, snippets[span]))
+    return result
+
+
+def parse_chunk(
+    chunk: list[tuple[int, bytes]], context_lines: int | None = None
+) -> list[tuple[str, int, int, bytes | None]]:
+    """Worker entry point, gets the (full path, line number, file index, snippet) of every call"""
+    return [
+        (full_path, line_number, index, snippet)
+        for index, data in chunk
+        for full_path, line_number, snippet in parse_source(data, context_lines)
+    ]
+
+
+def blob_hash(data: bytes) -> str:
+    """Get the git blob sha of a file content, the same GitHub shows"""
+    return sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
 class RepoParser:
-    def __init__(self, repository: Repository) -> None:
+    def __init__(
+        self,
+        repository: Repository,
+        executor: Executor | None = None,
+        known_hashes: dict[str, str] | None = None,
+        context_lines: int | None = 2,
+        release_sources: bool = False,
+    ) -> None:
+        """
+        :param executor: A process pool to parse files in, the repository is
+                         parsed in the calling process when not given.
+        :param known_hashes: Blob hashes by path of the already indexed files,
+                             files that didn't change are not parsed again.
+        :param context_lines: Lines around every call kept in its snippet, no
+                              snippets are kept when None.
+        :param release_sources: Drops the source kept in memory by the files as
+                                soon as they are read, the repository can't be
+                                parsed again from files without a loader.
+        """
         self.repository = repository
+        self.executor = executor
+        self.known_hashes = known_hashes or {}
+        self.context_lines = context_lines
+        self.release_sources = release_sources
+        # Blob hashes of every file read by get_repo_calls
+        self.file_hashes: dict[str, str] = {}
         self.folder_names = {item.name for item in repository.directory.walk(Folder)}
-        self.builtins = {name for name, call in vars(builtins).items() if getattr(call, '__call__', None)}
+        self.builtins = BUILTINS
         self.file_names = {
-            item.name for item in repository.directory.walk(File) if item.data
+            item.name for item in repository.directory.walk(File) if item.has_source
         }
 
-    def _get_call_path(self, item: expr) -> list[str]:
-        """Get a list of names from method call"""
-        path = []
-        # TODO searching args too?
-        while True:
-            type_ = type(item)
-            if type_ is Name:
-                path.append(item.id)
-                break
-            elif type_ is Attribute:
-                path.append(item.attr)
-                item = item.value
-            elif type_ is AstCall:
-                item = item.func
-            elif type_ is Subscript:
-                item = item.value
-            elif type_ is IfExp:
-                # TODO skipping ifs atm
-                break
-            else:
-                break
-        return path[::-1]
+    @property
+    def changed_files(self) -> set[str]:
+        """Paths of the files added or modified since the known hashes"""
+        return {
+            path for path, hash_ in self.file_hashes.items()
+            if self.known_hashes.get(path) != hash_
+        }
 
-    def _get_import_path(
-        self,
-        call: AstCall,
-        call_path: list[str],
-        classes: list[ClassDef],
-        file_imports: list[ImportFrom | Import],
-    ) -> list[str]:
-        """Get the full function path from the module"""
-        first_call = call_path[0]
-        if first_call == "super":
-            # We search for the inherited class
-            for class_ in classes:
-                called_in_class = call.lineno in range(
-                    class_.lineno, class_.end_lineno + 1
-                )
-                if called_in_class and class_.bases:
-                    # TODO MULTIPLE INHERITANCES
-                    class_path = self._get_call_path(class_.bases[0])
-                    call_path = class_path + call_path
-                    first_call = call_path[0]
-                    break
-                elif called_in_class and not class_.bases:
-                    return []
-        for import_ in file_imports:
-            if first_call in (alias.name for alias in import_.names):
-                if isinstance(import_, ImportFrom):
-                    call_path = import_.module.split(".") + call_path
-                return call_path
-        if first_call in self.builtins:
-            return call_path
+    @property
+    def deleted_files(self) -> set[str]:
+        return self.known_hashes.keys() - self.file_hashes.keys()
 
     def _is_local(self, path: list[str]) -> bool:
         """
@@ -82,49 +289,81 @@ class RepoParser:
         package = path[0]
         return package in self.folder_names or package in self.file_names
 
-    def get_call_full_path(self, call: Call) -> list[str] | None:
-        function_path = self._get_call_path(call)
-        full_path = None
-        if function_path:
-            full_path = self._get_import_path(
-                call, function_path, self.file_classes, self.file_imports
-            )
-        return full_path
-
     def get_file_calls(self, file: File) -> list[Call]:
         """
         Get all the full path of every external method call, uses the folder and
         file names to filter local imports
         """
-        calls = []
-        if not file.data:
-            return calls
-        try:
-            module = ast.parse(file.data)
-        except SyntaxError:
-            return calls
-
-        def is_import(x):
-            return (
-                isinstance(x, (Import)) or isinstance(x, (ImportFrom)) and x.level == 0
-            )
-
-        self.file_imports = [node for node in ast.walk(module) if is_import(node)]
-        self.file_classes = [node for node in ast.walk(module) if isinstance(node, ClassDef)]
-        function_calls = (
-            node for node in ast.walk(module) if isinstance(node, AstCall)
-        )
-        for call in function_calls:
-            full_path = self.get_call_full_path(call)
-            if full_path and not self._is_local(full_path):
-                calls.append(Call(".".join(full_path), call.lineno, file))
-        return calls
+        return self._get_calls(file, file.read())
 
-    def get_repo_calls(self) -> set[Call]:
+    def _get_calls(self, file: File, data: bytes | None) -> list[Call]:
+        if not data:
+            return []
+        return [
+            Call(full_path, line_number, file, self.repository.full_name, snippet)
+            for full_path, line_number, snippet in parse_source(data, self.context_lines)
+            if not self._is_local(full_path.split(".", 1))
+        ]
+
+    def _read_changed_files(self, files: list[File]) -> Iterator[tuple[int, bytes]]:
+        """Reads the files one by one, skipping the ones with a known hash"""
+        for index, file in enumerate(files):
+            data = file.read()
+            if self.release_sources:
+                file.release()
+            if data is None:
+                continue
+            hash_ = blob_hash(data)
+            self.file_hashes[file.path] = hash_
+            if self.known_hashes.get(file.path) == hash_:
+                continue
+            yield index, data
+
+    def _get_pooled_calls(self, files: list[File]) -> Iterator[Call]:
+        """
+        Parses the files in the process pool. Only the sources are sent to the
+        workers and only a bounded number of chunks is read and kept in flight
+        """
+        changed_files = self._read_changed_files(files)
+        pending: set[Future] = set()
+        while chunk := list(islice(changed_files, CHUNK_SIZE)):
+            pending.add(self.executor.submit(parse_chunk, chunk, self.context_lines))
+            if len(pending) < PENDING_CHUNKS:
+                continue
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield from self._calls_from_tuples(files, future.result())
+        for future in pending:
+            yield from self._calls_from_tuples(files, future.result())
+
+    def _calls_from_tuples(
+        self, files: list[File], call_tuples: list[tuple[str, int, int, bytes | None]]
+    ) -> Iterator[Call]:
+        for full_path, line_number, index, snippet in call_tuples:
+            if not self._is_local(full_path.split(".", 1)):
+                yield Call(
+                    full_path, line_number, files[index], self.repository.full_name, snippet
+                )
+
+    def iter_repo_calls(self) -> Iterator[Call]:
+        """
+        Yields the calls of every file as soon as it's parsed, grouped by file.
+        The file path is part of the call ids, so duplicates are skipped file
+        by file without keeping the ids of the whole repository.
+        """
         logger.info(f"Parsing {len(self.file_names)} files from {self.repository.name}")
-        all_calls = set()
-        for file in self.repository.directory.walk(File):
+        files = [file for file in self.repository.directory.walk(File) if file.has_source]
+        for _, file_calls in groupby(self._iter_calls(files), key=lambda call: id(call.file)):
+            yield from dict.fromkeys(file_calls)
+
+    def _iter_calls(self, files: list[File]) -> Iterator[Call]:
+        if self.executor is not None:
+            yield from self._get_pooled_calls(files)
+            return
+        for index, data in self._read_changed_files(files):
+            file = files[index]
             logger.debug(f"Reading {file.name}  --> {file.web_url}")
-            file_calls = self.get_file_calls(file)
-            all_calls.update(call for call in file_calls if call not in all_calls)
-        return all_calls
+            yield from self._get_calls(file, data)
+
+    def get_repo_calls(self) -> set[Call]:
+        return set(self.iter_repo_calls())
@@ -1,30 +1,73 @@
 import logging
 import re
-from io import BytesIO
-from typing import Iterator
-from zipfile import ZipFile
+from fnmatch import fnmatch
+from functools import partial
+from tempfile import SpooledTemporaryFile
+from typing import Callable, Iterable, Iterator
+from zipfile import ZipInfo
 
 from models.file import File
 from models.folder import Folder
 from models.repository import Repository
+from utils.archive import Archive
+from utils.cache import ArchiveStore, ResponseCache
+from utils.metrics import metrics
 from utils.request import Request
+from utils.scheduler import Priority, RequestScheduler
 
 logger = logging.getLogger(__name__)
 
 
 class RepoScraper:
     IGNORED_FOLDERS = {".vscode"}
+    MAX_FILE_SIZE = 1024 * 1024
+    SPOOL_SIZE = 16 * 1024 * 1024
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
     repository_regex = re.compile(r"REPOSITORY_NAME_HEADING")
     headers = {
         "Accept": "application/vnd.github+json",
-        "Authorization": "Bearer ",
     }
 
-    def __init__(self, api_token: str):
-        self.session = Request(self.headers)
-        self.headers["Authorization"] += api_token
+    def __init__(
+        self,
+        api_tokens: Iterable[str],
+        max_file_size: int = MAX_FILE_SIZE,
+        skip_globs: tuple[str, ...] = (),
+        spool_size: int = SPOOL_SIZE,
+        response_cache: ResponseCache | None = None,
+        archive_store: ArchiveStore | None = None,
+        request_concurrency: int = 5,
+        api_url: str = "https://api.github.com",
+        web_url: str = "https://github.com",
+    ):
+        """
+        :param api_tokens: GitHub tokens, the API requests rotate over them.
+        :param max_file_size: Python files bigger than this are skipped, 0 means no limit.
+        :param skip_globs: Patterns of the repository relative paths to skip,
+                           like vendored, generated or test folders.
+        :param spool_size: Archives bigger than this are downloaded to disk.
+        :param response_cache: Cache for the API responses.
+        :param archive_store: Keeps the downloaded archives by commit.
+        :param request_concurrency: Max requests in flight to GitHub.
+        :param api_url: Base url of the REST API, e.g. of a local stub server.
+        :param web_url: Base url of the topic pages and the archives.
+        """
+        scheduler = RequestScheduler(api_tokens, request_concurrency)
+        self.session = Request(self.headers, response_cache, scheduler)
+        self.api_url = api_url.rstrip("/")
+        self.web_url = web_url.rstrip("/")
+        self.max_file_size = max_file_size
+        self.skip_globs = skip_globs
+        self.spool_size = spool_size
+        self.archive_store = archive_store
 
-    def get_repository(self, repo_url: str) -> Repository | None:
+    def get_repository(
+        self, repo_url: str, is_indexed: Callable[[str, str], bool] | None = None
+    ) -> Repository | None:
+        """
+        :param is_indexed: Tells if a repository full name is already indexed at a
+                           commit, those repositories are not downloaded again.
+        """
         # https://api.github.com/repos/home-assistant/core
         logger.info(f"Scraping {repo_url.split('/')[-1]}")
         repo_data = self.session.json_request(repo_url)
@@ -33,7 +76,17 @@ class RepoScraper:
             html_url = repo_data["html_url"]
             owner_name = repo_data["owner"]["login"]
             last_commit_hash = self._get_last_commit_hash(repo_data['commits_url'])
-            contents_folder = self._get_repo_files(owner_name, repo_data["name"], last_commit_hash, html_url)
+            full_name = f"{owner_name}/{repo_data['name']}"
+            if is_indexed is not None and is_indexed(full_name, last_commit_hash):
+                logger.info(f"{full_name} is up to date at {last_commit_hash}")
+                return None
+            with metrics.timer("download"):
+                archive = self._get_repo_archive(owner_name, repo_data["name"], last_commit_hash)
+            if archive is None:
+                logger.warning(f"Couldn't download {repo_url}")
+                return None
+            with metrics.timer("zip_index"):
+                contents_folder = self._get_folder_from_zip(archive, html_url, last_commit_hash)
             repo = Repository(
                 repo_data["id"],
                 repo_data["name"],
@@ -43,77 +96,113 @@ class RepoScraper:
                 repo_data["language"],
                 default_branch,
                 contents_folder,
+                last_commit_hash,
+                archive,
             )
             return repo
 
     def get_top_repos(self, max_results: int = 0) -> Iterator[Repository]:
+        for url in self.get_top_repo_urls(max_results):
+            yield self.get_repository(url)
+
+    def get_top_repo_urls(self, max_results: int = 0) -> Iterator[str]:
+        """Get the API urls of the top python repositories, 0 means no limit"""
         repo_count = 0
-        paginate = True
         page = 1
-        while paginate:
-            url = f"https://github.com/topics/python?page={page}"
-            soup = self.session.soup_request(url, {})
+        while True:
+            url = f"{self.web_url}/topics/python?page={page}"
+            soup = self.session.soup_request(url, {}, authenticated=False)
+            if soup is None:
+                break
             headers = soup.select("article h3")
             repo_anchors = (
                 header.find("a", {"data-hydro-click": self.repository_regex})
                 for header in headers
             )
             repo_urls = {
-                "https://api.github.com/repos" + a["href"] for a in repo_anchors
+                f"{self.api_url}/repos{a['href']}" for a in repo_anchors
             }
             if not repo_urls:
                 break
             for url in repo_urls:
-                yield self.get_repository(url)
-                if repo_count and repo_count == max_results:
-                    paginate = False
-                    break
+                yield url
                 repo_count += 1
+                if repo_count == max_results:
+                    return
             page += 1
 
-    def _get_repo_files(
-        self, owner_name: str, repo_name: str, commit_sha: str, html_url: str
-    ) -> Folder:
-        zip_url = f"https://github.com/{owner_name}/{repo_name}/archive/{commit_sha}.zip"
-        zip_response = self.session.request(zip_url)
-        with ZipFile(BytesIO(zip_response.content)) as zip_file:
-            return self._get_folder_from_zip(
-                zip_file, html_url, commit_sha
-            )
+    def _get_repo_archive(
+        self, owner_name: str, repo_name: str, commit_sha: str
+    ) -> Archive | None:
+        """
+        Streams the zipball to a temporary file, kept in memory only if it's
+        small, or to the archive store if there is one
+        """
+        if self.archive_store is not None:
+            path = self.archive_store.get(commit_sha)
+            if path is not None:
+                logger.debug(f"Archive {commit_sha} found in store")
+                return Archive(open(path, "rb"))
+        zip_url = f"{self.web_url}/{owner_name}/{repo_name}/archive/{commit_sha}.zip"
+        zip_response = self.session.request(
+            zip_url, stream=True, priority=Priority.DOWNLOAD, authenticated=False
+        )
+        if zip_response is None:
+            return None
+        if self.archive_store is not None:
+            with zip_response:
+                path = self.archive_store.put(
+                    commit_sha, zip_response.iter_content(self.DOWNLOAD_CHUNK_SIZE)
+                )
+            return Archive(open(path, "rb"))
+        file = SpooledTemporaryFile(max_size=self.spool_size)
+        with zip_response:
+            for chunk in zip_response.iter_content(self.DOWNLOAD_CHUNK_SIZE):
+                file.write(chunk)
+        file.seek(0)
+        return Archive(file)
+
+    def _skip_member(self, member: ZipInfo, path: str) -> bool:
+        if self.max_file_size and member.file_size > self.max_file_size:
+            logger.debug(f"Skipping {path}, {member.file_size} bytes")
+            return True
+        return any(fnmatch(path, glob) for glob in self.skip_globs)
 
     def _get_folder_from_zip(
-        self, zip_file: ZipFile, html_url: str, commit_sha: str
+        self, archive: Archive, html_url: str, commit_sha: str
     ) -> Folder:
-        """Parses zip file to Folder/File structure"""
-        estructure = {}
-        for file_name in zip_file.namelist():
-            path = file_name.split("/")
-            pos = estructure
-            for depth, item in enumerate(ele for ele in path if ele):
-                is_folder = depth < len(path) - 1
-                value = pos.get(item)
-                if value is None and is_folder:
-                    pos[item] = {}
-                elif value is None and not is_folder:
-                    # Not extracting unless its a python file
-                    data = zip_file.read(file_name) if item.endswith(".py") else None
-                    file_url = f"{html_url}/blob/{commit_sha}/{'/'.join(path[1:])}"
-                    pos[item] = File(item, file_url, data)
-                pos = pos[item]
-        return next(iter(self._dict_to_folders(estructure)))
+        """
+        Parses zip file to Folder/File structure, only python files are kept
+        and their data is read from the archive when needed
+        """
+        folders: dict[tuple[str, ...], Folder] = {}
+
+        def get_folder(path: tuple[str, ...]) -> Folder:
+            folder = folders.get(path)
+            if folder is None:
+                folder = folders[path] = Folder(path[-1], [])
+                if len(path) > 1:
+                    get_folder(path[:-1]).files.append(folder)
+            return folder
+
+        for member in archive.members():
+            path = tuple(item for item in member.filename.split("/") if item)
+            if member.is_dir():
+                get_folder(path)
+                continue
+            # Not extracting unless its a python file
+            if len(path) < 2 or not path[-1].endswith(".py"):
+                continue
+            folder = get_folder(path[:-1])
+            relative_path = "/".join(path[1:])
+            if self._skip_member(member, relative_path):
+                continue
+            file_url = f"{html_url}/blob/{commit_sha}/{relative_path}"
+            loader = partial(archive.read, member.filename)
+            folder.files.append(File(path[-1], file_url, path=relative_path, loader=loader))
+        return next(folder for path, folder in folders.items() if len(path) == 1)
 
     def _get_last_commit_hash(self, commits_url: str) -> str:
         url = commits_url.replace("{/sha}", "?per_page=1")
         res = self.session.json_request(url=url, headers=self.headers)
         return res[0]['sha']
-
-    def _dict_to_folders(self, estructure: dict) -> list[Folder]:
-        """transform dict folder structure to class Folder"""
-        folders = []
-        for key, item in estructure.items():
-            if isinstance(item, dict):
-                folder = Folder(key, self._dict_to_folders(item))
-                folders.append(folder)
-            else:
-                folders.append(item)
-        return folders
@@ -0,0 +1,73 @@
+import logging
+import shutil
+import tarfile
+import threading
+from tempfile import SpooledTemporaryFile
+from typing import IO, Iterator
+from zipfile import ZipFile, ZipInfo
+
+logger = logging.getLogger(__name__)
+
+
+class Archive:
+    """Zip archive backed by a (spooled) file, members are only read on demand"""
+
+    def __init__(self, file: IO[bytes]) -> None:
+        self.file = file
+        self.zip_file = ZipFile(file)
+
+    def members(self) -> list[ZipInfo]:
+        return self.zip_file.infolist()
+
+    def read(self, member: str) -> bytes:
+        return self.zip_file.read(member)
+
+    def close(self) -> None:
+        self.zip_file.close()
+        self.file.close()
+
+
+class TarArchive:
+    """
+    Tarball whose members are read on demand. An uncompressed tarball is read
+    in place. The members of a compressed one are copied to a spooled file
+    while it's read in order, it can't be read out of order without
+    decompressing it again.
+    """
+
+    def __init__(self, path: str, compressed: bool, spool_size: int) -> None:
+        """
+        :param spool_size: Copied members bigger than this in total go to disk.
+        """
+        self.tar_file = tarfile.open(path, "r:*" if compressed else "r:")
+        self.spool = SpooledTemporaryFile(max_size=spool_size) if compressed else None
+        # Offset and size of the copied members in the spool
+        self.offsets: dict[str, tuple[int, int]] = {}
+        self.infos: dict[str, tarfile.TarInfo] = {}
+        self.lock = threading.Lock()
+
+    def members(self) -> Iterator[tarfile.TarInfo]:
+        return iter(self.tar_file)
+
+    def add(self, member: tarfile.TarInfo) -> None:
+        """Keeps a member to read it later, while the members are iterated"""
+        if self.spool is None:
+            self.infos[member.name] = member
+            return
+        with self.lock:
+            offset = self.spool.seek(0, 2)
+            shutil.copyfileobj(self.tar_file.extractfile(member), self.spool)
+            self.offsets[member.name] = (offset, self.spool.tell() - offset)
+
+    def read(self, member: str) -> bytes:
+        with self.lock:
+            if self.spool is None:
+                return self.tar_file.extractfile(self.infos[member]).read()
+            offset, size = self.offsets[member]
+            self.spool.seek(offset)
+            return self.spool.read(size)
+
+    def close(self) -> None:
+        self.tar_file.close()
+        if self.spool is not None:
+            self.spool.close()
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import threading
+from hashlib import sha256
+from tempfile import NamedTemporaryFile
+from typing import Iterable
+
+from requests import Response
+from requests.structures import CaseInsensitiveDict
+
+logger = logging.getLogger(__name__)
+
+
+def _write_atomic(path: str, chunks: Iterable[bytes]) -> int:
+    """Writes to a temporary file and renames it so readers never see partial files"""
+    size = 0
+    directory = os.path.dirname(path)
+    with NamedTemporaryFile("wb", dir=directory, delete=False) as file:
+        try:
+            for chunk in chunks:
+                file.write(chunk)
+                size += len(chunk)
+        except BaseException:
+            file.close()
+            os.unlink(file.name)
+            raise
+    os.replace(file.name, path)
+    return size
+
+
+class ResponseCache:
+    """
+    On-disk cache of response bodies keyed by url, stored with their ETag and
+    Last-Modified validators to revalidate them with conditional requests
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, url: str) -> str:
+        return os.path.join(self.directory, sha256(url.encode("utf-8")).hexdigest())
+
+    def _read_meta(self, url: str) -> dict | None:
+        try:
+            with open(self._path(url) + ".json", encoding="utf-8") as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def validators(self, url: str) -> dict:
+        """Get the conditional request headers for a cached url"""
+        meta = self._read_meta(url)
+        if meta is None:
+            return {}
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers
+
+    def get(self, url: str, not_modified: Response | None = None) -> Response | None:
+        """
+        Rebuilds the cached response, updating its headers with the ones from
+        the 304 response if given
+        """
+        meta = self._read_meta(url)
+        if meta is None:
+            return None
+        try:
+            with open(self._path(url), "rb") as file:
+                content = file.read()
+        except OSError:
+            return None
+        response = Response()
+        response.status_code = meta["status_code"]
+        response.url = url
+        response.encoding = meta.get("encoding")
+        response.headers = CaseInsensitiveDict(meta["headers"])
+        if not_modified is not None:
+            response.headers.update(not_modified.headers)
+        response._content = content
+        return response
+
+    def put(self, url: str, response: Response) -> None:
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if not (etag or last_modified):
+            return
+        meta = {
+            "status_code": response.status_code,
+            "encoding": response.encoding,
+            "headers": dict(response.headers),
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+        path = self._path(url)
+        try:
+            _write_atomic(path, (response.content,))
+            _write_atomic(path + ".json", (json.dumps(meta).encode("utf-8"),))
+        except OSError as ex:
+            logger.warning(f"Couldn't cache {url}: {ex}")
+
+
+class ArchiveStore:
+    """
+    Content addressed store of repository archives keyed by commit sha. When
+    the store grows over max_size the least recently used archives are evicted
+    """
+
+    def __init__(self, directory: str, max_size: int) -> None:
+        self.directory = directory
+        self.max_size = max_size
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(
+            entry.stat().st_size for entry in os.scandir(directory) if entry.is_file()
+        )
+
+    def _path(self, commit_sha: str) -> str:
+        return os.path.join(self.directory, f"{commit_sha}.zip")
+
+    def get(self, commit_sha: str) -> str | None:
+        """Get the path of a stored archive, marking it as recently used"""
+        path = self._path(commit_sha)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, commit_sha: str, chunks: Iterable[bytes]) -> str:
+        path = self._path(commit_sha)
+        size = _write_atomic(path, chunks)
+        with self.lock:
+            self.size += size
+            self._evict(keep=path)
+        return path
+
+    def _evict(self, keep: str) -> None:
+        if self.size <= self.max_size:
+            return
+        entries = sorted(
+            (entry for entry in os.scandir(self.directory) if entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        for entry in entries:
+            if self.size <= self.max_size:
+                break
+            if entry.path == keep:
+                continue
+            try:
+                size = entry.stat().st_size
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                continue
+            self.size -= size
+            logger.debug(f"Evicted archive {entry.name}")
@@ -0,0 +1,102 @@
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterable, Iterator
+
+logger = logging.getLogger(__name__)
+
+# Repository the current thread is working on, to attribute its timings
+current_repository: ContextVar[str | None] = ContextVar("current_repository", default=None)
+
+
+class Metrics:
+    """Thread safe stage timers and counters, in total and by repository"""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.seconds: dict[str, float] = defaultdict(float)
+        self.counts: dict[str, int] = defaultdict(int)
+        self.repository_seconds: dict[str, dict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.repository_counts: dict[str, dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.start = time.perf_counter()
+
+    @contextmanager
+    def repository(self, name: str) -> Iterator[None]:
+        """Attributes the timings and counts of the block to a repository"""
+        token = current_repository.set(name)
+        try:
+            yield
+        finally:
+            current_repository.reset(token)
+
+    @contextmanager
+    def timer(self, stage: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(stage, time.perf_counter() - start)
+
+    def timed(self, stage: str, iterable: Iterable) -> Iterator:
+        """
+        Yields the items of an iterable, timing only the time spent producing
+        them and not the time its consumer holds every item
+        """
+        seconds = 0.0
+        iterator = iter(iterable)
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    seconds += time.perf_counter() - start
+                yield item
+        finally:
+            self.add_time(stage, seconds)
+
+    def add_time(self, stage: str, seconds: float) -> None:
+        repository = current_repository.get()
+        with self.lock:
+            self.seconds[stage] += seconds
+            self.counts[stage] += 1
+            if repository:
+                self.repository_seconds[repository][stage] += seconds
+
+    def count(self, name: str, value: int = 1) -> None:
+        repository = current_repository.get()
+        with self.lock:
+            self.counts[name] += value
+            if repository:
+                self.repository_counts[repository][name] += value
+
+    def log_repository(self, name: str) -> None:
+        """Logs and forgets the metrics of a repository"""
+        with self.lock:
+            seconds = self.repository_seconds.pop(name, {})
+            counts = self.repository_counts.pop(name, {})
+        stats = [f"{stage} {value:.2f}s" for stage, value in seconds.items()]
+        stats += [f"{counter} {value}" for counter, value in counts.items()]
+        if stats:
+            logger.info(f"{name} metrics: {', '.join(stats)}")
+
+    def log_summary(self) -> None:
+        elapsed = time.perf_counter() - self.start
+        with self.lock:
+            lines = [
+                f"{stage:>16}: {seconds:10.2f}s in {self.counts[stage]} calls"
+                for stage, seconds in sorted(self.seconds.items(), key=lambda item: -item[1])
+            ]
+            lines += [
+                f"{name:>16}: {count}"
+                for name, count in sorted(self.counts.items()) if name not in self.seconds
+            ]
+        logger.info(f"Finished in {elapsed:.1f}s\n" + "\n".join(lines))
+
+
+metrics = Metrics()
@@ -1,54 +1,116 @@
 import logging
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from datetime import datetime
 from typing import Iterable, Iterator, Literal
 
 from bs4 import BeautifulSoup
 from requests import HTTPError, Response, Session
 
+from utils.cache import ResponseCache
+from utils.metrics import metrics
+from utils.scheduler import Priority, RequestScheduler
+
 logger = logging.getLogger(__name__)
 
 class Request:
     session: Session
     headers: dict
 
-    def __init__(self, headers: dict):
+    def __init__(
+        self,
+        headers: dict,
+        cache: ResponseCache | None = None,
+        scheduler: RequestScheduler | None = None,
+    ):
+        """
+        :param cache: Stores the responses to revalidate them with conditional
+                      requests, not modified responses don't count for the rate limit.
+        :param scheduler: Shared rate limits and tokens of the requests.
+        """
         self.session = Session()
         self.headers = headers
+        self.cache = cache
+        self.scheduler = scheduler or RequestScheduler()
 
     def request(
-        self, url: str, max_attempts: int = 5, headers: dict | None = None
+        self,
+        url: str,
+        max_attempts: int = 5,
+        headers: dict | None = None,
+        stream: bool = False,
+        priority: Priority = Priority.METADATA,
+        authenticated: bool = True,
     ) -> Response | None:
+        """
+        Sends a GET request when the scheduler allows it. Rate limited requests
+        are retried once the token is refilled, without counting as attempts.
+
+        :param authenticated: Sends the request with one of the scheduler tokens.
+        """
         sleep_time = 10
         headers = headers if headers is not None else self.headers
-        for attempt in range(max_attempts):
+        use_cache = self.cache is not None and not stream
+        if use_cache:
+            headers = {**headers, **self.cache.validators(url)}
+        attempt = 0
+        while attempt < max_attempts:
+            with metrics.timer("rate_limit_wait"):
+                bucket = self.scheduler.acquire(priority, authenticated)
+            request_headers = headers
+            if bucket.token:
+                request_headers = {**headers, "Authorization": f"Bearer {bucket.token}"}
+            try:
+                with metrics.timer("request"):
+                    response = self.session.get(url, headers=request_headers, stream=stream)
+            except Exception as ex:
+                self.scheduler.release(bucket)
+                attempt += 1
+                logger.warning(ex)
+                logger.warning(f"Waiting {sleep_time}.\nAttempt {attempt} / {max_attempts}")
+                with metrics.timer("request_sleep"):
+                    time.sleep(sleep_time)
+                continue
+            logger.debug(f"Status {response.status_code} on {url}")
+            if self.scheduler.release(bucket, response.headers, response.status_code):
+                metrics.count("rate_limited")
+                logger.info(f"Rate limited on {url}, retrying when allowed")
+                response.close()
+                continue
+            if use_cache and response.status_code == 304:
+                metrics.count("not_modified")
+                cached = self.cache.get(url, response)
+                if cached is not None:
+                    return cached
+                # Lost the cached body, asks again for it
+                attempt += 1
+                headers = {
+                    key: value for key, value in headers.items()
+                    if key not in ("If-None-Match", "If-Modified-Since")
+                }
+                continue
             try:
-                response = self.session.get(url, headers=headers)
-                logger.debug(f"Status {response.status_code} on {url}")
                 response.raise_for_status()
-                return response
             except HTTPError as ex:
-                logger.debug(ex)
-                remaining_requests = int(response.headers.get("X-RateLimit-Remaining"))
-                if response.status_code == 403 and not remaining_requests:
-                    now = time.time()
-                    release_timestamp = int(response.headers.get("X-RateLimit-Reset"))
-                    remaining_time = release_timestamp - now
-                    release_time = datetime.fromtimestamp(release_timestamp)
-                    logger.info(
-                        f"API limit exceeded waiting until {release_time.strftime('%H:%M:%S')}"
-                    )
-                    time.sleep(remaining_time + 5)
-            except Exception as ex:
+                response.close()
+                attempt += 1
+                if response.status_code < 500:
+                    # Not found, forbidden... won't change by retrying
+                    logger.warning(ex)
+                    return None
                 logger.warning(ex)
                 logger.warning(f"Waiting {sleep_time}.\nAttempt {attempt} / {max_attempts}")
-                time.sleep(sleep_time)
+                with metrics.timer("request_sleep"):
+                    time.sleep(sleep_time)
+                continue
+            if use_cache:
+                self.cache.put(url, response)
+            return response
+        return None
 
     def soup_request(
-        self, url: str, headers: dict | None = None
+        self, url: str, headers: dict | None = None, authenticated: bool = True
     ) -> BeautifulSoup | None:
-        response = self.request(url, headers=headers)
+        response = self.request(url, headers=headers, authenticated=authenticated)
         if response:
             return BeautifulSoup(response.text, "lxml")
 
@@ -0,0 +1,210 @@
+import itertools
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from enum import IntEnum
+from typing import Iterable, Mapping
+
+logger = logging.getLogger(__name__)
+
+# GitHub asks to wait at least a minute on secondary limits without Retry-After
+SECONDARY_LIMIT_WAIT = 60
+
+
+class Priority(IntEnum):
+    """Lower values are served first"""
+    METADATA = 0
+    DOWNLOAD = 1
+
+
+def header_number(headers: Mapping[str, str], name: str) -> int | None:
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> float | None:
+    """Get the seconds of a Retry-After header, given as seconds or as a date"""
+    value = headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class TokenBucket:
+    """
+    Requests a token can still make, refilled from the X-RateLimit headers
+    GitHub returns with every response
+    """
+    token: str | None
+    # Requests left until reset, None until a response tells
+    remaining: int | None = None
+    # Requests of every window, to refill the bucket when a window ends
+    limit: int | None = None
+    # Epoch seconds when the remaining requests are refilled, inf until a
+    # response of the current window tells
+    reset: float = 0
+    # Secondary rate limit, no requests until then
+    blocked_until: float = 0
+    in_flight: int = 0
+    # Until the first response, it's unknown if the server limits the requests
+    responded: bool = False
+
+    def ready_at(self, now: float) -> float:
+        """
+        Get when the bucket can send a request, now if it can already and
+        inf if it has to wait for the response of a request in flight
+        """
+        if not self.responded and self.in_flight:
+            # Only one request until the first response tells the budget
+            return float("inf")
+        ready = max(self.blocked_until, now)
+        if self.remaining is not None and self.remaining <= 0 and self.reset > now:
+            ready = max(ready, self.reset)
+        return ready
+
+    def take(self, now: float) -> None:
+        if self.remaining is not None and now >= self.reset:
+            # A new window started
+            self.remaining, self.reset = self.limit, float("inf")
+        if self.remaining is not None:
+            self.remaining -= 1
+        self.in_flight += 1
+
+    def update(self, headers: Mapping[str, str] | None, status_code: int, now: float) -> bool:
+        """
+        Refills the bucket from the response headers.
+
+        :return: True if the request was rejected by a rate limit.
+        """
+        self.in_flight -= 1
+        if headers is None:
+            if self.reset == float("inf"):
+                # Failed before telling the window, the next request probes it
+                self.remaining = None
+            return False
+        self.responded = True
+        remaining = header_number(headers, "X-RateLimit-Remaining")
+        reset = header_number(headers, "X-RateLimit-Reset")
+        self.limit = header_number(headers, "X-RateLimit-Limit") or self.limit
+        if remaining is not None and reset is not None:
+            if reset != self.reset or self.remaining is None:
+                self.remaining, self.reset = remaining, reset
+            else:
+                # Responses of concurrent requests arrive out of order
+                self.remaining = min(self.remaining, remaining)
+        elif self.reset == float("inf"):
+            self.remaining = None
+        if status_code not in (403, 429):
+            return False
+        retry_after = retry_after_seconds(headers)
+        if retry_after is not None:
+            self.blocked_until = now + retry_after
+            return True
+        if remaining == 0:
+            # Waits for the reset, at least a second if its clock is behind ours
+            self.blocked_until = max(self.blocked_until, now + 1)
+            return True
+        if status_code == 429 or "rate limit" in headers.get("X-GitHub-Error", "").lower():
+            self.blocked_until = now + SECONDARY_LIMIT_WAIT
+            return True
+        # A 403 for any other reason, like a private repository
+        return False
+
+
+class RequestScheduler:
+    """
+    Shared by every thread sending requests to GitHub. Limits the requests in
+    flight, spreads the authenticated ones over the tokens with the most
+    budget left, makes them wait until a token is refilled instead of failing
+    and serves the waiting requests by priority.
+    """
+
+    def __init__(self, tokens: Iterable[str] = (), max_concurrency: int = 5) -> None:
+        self.buckets = [TokenBucket(token) for token in tokens if token]
+        # Unauthenticated requests have a budget of their own
+        self.anonymous = TokenBucket(None)
+        self.max_concurrency = max(max_concurrency, 1)
+        self.active = 0
+        # (priority, arrival, authenticated) of the waiting requests
+        self.waiting: list[tuple[int, int, bool]] = []
+        self.arrivals = itertools.count()
+        self.condition = threading.Condition()
+
+    def _candidates(self, authenticated: bool) -> list[TokenBucket]:
+        return self.buckets if authenticated and self.buckets else [self.anonymous]
+
+    def _pick(self, authenticated: bool, now: float) -> TokenBucket | None:
+        """Get the ready bucket with the most requests left, unknown budgets first"""
+        ready = [
+            bucket for bucket in self._candidates(authenticated) if bucket.ready_at(now) <= now
+        ]
+        if not ready:
+            return None
+        return max(
+            ready,
+            key=lambda bucket: float("inf") if bucket.remaining is None else bucket.remaining,
+        )
+
+    def _is_next(self, entry: tuple[int, int, bool], now: float) -> bool:
+        """Tells if the request is the first waiting one that can be sent now"""
+        for waiting in sorted(self.waiting):
+            if self._pick(waiting[2], now) is not None:
+                return waiting == entry
+        return False
+
+    def acquire(self, priority: int = Priority.METADATA, authenticated: bool = True) -> TokenBucket:
+        """
+        Waits for a free slot and a token with budget left.
+
+        :return: The bucket of the token to send the request with, its token
+                 is None for unauthenticated requests.
+        """
+        with self.condition:
+            entry = (int(priority), next(self.arrivals), authenticated)
+            self.waiting.append(entry)
+            try:
+                while True:
+                    now = time.time()
+                    if self.active < self.max_concurrency and self._is_next(entry, now):
+                        bucket = self._pick(authenticated, now)
+                        break
+                    ready = min(bucket.ready_at(now) for bucket in self._candidates(authenticated))
+                    timeout = None
+                    if now < ready < float("inf"):
+                        timeout = max(ready - now, 0.05)
+                        if timeout > 1:
+                            logger.debug(f"Rate limited for {timeout:.0f}s")
+                    # Woken up by releases, or when the first token is refilled
+                    self.condition.wait(timeout)
+            finally:
+                self.waiting.remove(entry)
+                self.condition.notify_all()
+            bucket.take(now)
+            self.active += 1
+            return bucket
+
+    def release(
+        self, bucket: TokenBucket, headers: Mapping[str, str] | None = None, status_code: int = 0
+    ) -> bool:
+        """
+        Frees the slot of a request and refills its bucket from the response.
+
+        :return: True if the request was rejected by a rate limit and should be retried.
+        """
+        with self.condition:
+            self.active -= 1
+            rate_limited = bucket.update(headers, status_code, time.time())
+            self.condition.notify_all()
+        return rate_limited